@@ -0,0 +1,164 @@
+# File and data handling
+from omegaconf import DictConfig, OmegaConf
+import logging
+from pathlib import Path
+import yaml
+import numpy as np
+from datetime import datetime
+import time
+# Internal functions
+from dyann.algo.proxy import instantiate_algorithm
+from dyann.data.proxy import instantiate_dataset
+from dyann.util import stringify_dict, lerp
+from dyann.vis import draw_loglog, draw_heatmap
+from run import pregenerate
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def measure(algo, dataset, vecs, cfg, op, fill, batch, ingest):
+    """ Time do_add or do_update calls of one batch size on an index filled to the given number of samples
+
+    Parameters:
+        algo: An ANN algorithm inheriting from BaseANN
+        dataset: A dataset inheriting from BaseDataset, used for training
+        vecs: Writable matrix of samples, the first fill are indexed before measuring
+        cfg: OmegaConf object with the build properties at cfg.algo.build
+        op: Event measured, either add or update
+        fill: Number of samples indexed before measuring
+        batch: Number of samples passed to each call
+        ingest: OmegaConf object with the repeats and budget limits
+    Returns:
+        A list of the latency of each call, empty if the cell does not fit in the dataset
+    """
+    repeats = max(min(ingest.repeats, ingest.budget // batch), 1)
+    if op == "add":
+        repeats = min(repeats, (vecs.shape[0] - fill) // batch)
+    if repeats < 1 or (op == "update" and batch > fill):
+        return []
+    # Build the index up to the fill level
+    algo.init(D = vecs.shape[1], maxN = vecs.shape[0], cfg = cfg)
+    if algo.has_train():
+        algo.train(vecs=dataset.vecs_train())
+    algo.do_add(vecs=vecs[:fill], start = 0, count = fill)
+    # Time each call
+    latency = []
+    for r in range(repeats):
+        if op == "add":
+            start = fill + r * batch
+            t0 = time.perf_counter()
+            algo.do_add(vecs=vecs[:start+batch], start = start, count = batch)
+            latency.append(time.perf_counter() - t0)
+        else:
+            start = (r * batch) % (fill - batch + 1)
+            vecs[start:start+batch] = lerp(vecs[start:start+batch], vecs[start+1:start+batch+1], 0.1) # Move towards the next samples
+            t0 = time.perf_counter()
+            algo.do_update(vecs=vecs[:fill], start = start, count = batch)
+            latency.append(time.perf_counter() - t0)
+    return latency
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/ingest.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.load(cfg_path)
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+    timestamp = f"{datetime.now().strftime('%y-%m-%d-%H-%M-%S')}"
+    img = Path(base_cfg.img_out)
+    img.mkdir(exist_ok=True, parents=True)  # Make sure the img directory exists
+    ingest = base_cfg.ingest
+
+    # Sweep datasets
+    for data_name in base_cfg.data:
+        lines = {op: [] for op in ingest.ops}
+        # Sweep algorithms
+        for algo_name in base_cfg.algo:
+            # Instantiate a search algorithm class
+            cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_build.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+                continue
+            algo_cfg = OmegaConf.create(base_cfg)
+            algo_cfg.algo = {}
+            algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+            algo = instantiate_algorithm(cfg=algo_cfg)
+            # Instantiate a dataset class
+            cfg_path = Path(".").joinpath(f"conf/data/{data_name}.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping dataset {data_name} - no config at {cfg_path}")
+                continue
+            data_cfg = OmegaConf.create(algo_cfg)
+            data_cfg.data = {}
+            data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
+            # Sweep dataset scale parameters
+            for scale in data_cfg.data.scale:
+                scale_cfg = OmegaConf.create(data_cfg)
+                scale_cfg.data.scale = scale
+                dataset = instantiate_dataset(cfg=scale_cfg)
+                # Download the dataset files, recall is not measured so no groundtruth is generated
+                pregen_cfg = OmegaConf.create(scale_cfg)
+                pregen_cfg.groundtruth = False
+                pregenerate(dataset=dataset, scale_cfg=pregen_cfg)
+                base_size = dataset.vecs_base().shape[0]
+                query_vecs = dataset.vecs_query()
+                fills = [max(int(base_size * fill), 1) for fill in ingest.fills]
+                # Sweep algorithm build parameters
+                ret_all = []
+                for build in data_cfg.algo.build:
+                    build_cfg = OmegaConf.create(scale_cfg)
+                    build_cfg.algo.build = build
+                    ret = []
+                    for op in ingest.ops:
+                        # Measure each cell of the batch size and fill level matrix
+                        throughput = np.full([len(fills), len(ingest.batches)], np.nan)
+                        for f, fill in enumerate(fills):
+                            for b, batch in enumerate(ingest.batches):
+                                log.info(f"Start to {op} batches of {batch} at {fill} samples with {build}")
+                                vecs = np.array(query_vecs, dtype='float32') # Private copy, updates modify it
+                                latency = measure(algo=algo, dataset=dataset, vecs=vecs, cfg=build_cfg, op=op, fill=fill, batch=batch, ingest=ingest)
+                                if len(latency) == 0:
+                                    continue
+                                throughput[f,b] = batch * len(latency) / np.sum(latency)
+                                ret.append({
+                                    "param_build": dict(build),
+                                    "op": op, "fill": int(fill), "batch": int(batch), "calls": len(latency),
+                                    "latency_mean": float(np.mean(latency)),
+                                    "latency_p50": float(np.percentile(latency, 50)),
+                                    "latency_p99": float(np.percentile(latency, 99)),
+                                    "throughput": float(throughput[f,b])
+                                })
+                        # Plot the matrix of throughputs as a table
+                        label = f"{algo_name}-{scale}(" + stringify_dict(d=dict(build)) + ")"
+                        log.info(f"{op} throughput (samples/sec) of {label}, rows are fill levels {fills}, columns batch sizes {list(ingest.batches)}\n{throughput}")
+                        draw_heatmap(matrix=throughput, xticks=list(ingest.batches), yticks=fills, xlabel="batch size (samples)", ylabel="fill level (samples)",
+                            title=f"{op} throughput (samples/sec) {data_name} {label}", filename=img / f"ingest-{op}-{data_name}-{algo_name}-{scale}-{len(ret_all)}-{timestamp}.png", width=10, height=6)
+                        for f, fill in enumerate(fills):
+                            measured = ~np.isnan(throughput[f])
+                            if np.any(measured):
+                                lines[op].append({
+                                    "xs": np.array(ingest.batches)[measured], "ys": throughput[f][measured],
+                                    "ctrls": np.array(ingest.batches)[measured], "ctrl_label": "batch",
+                                    "label": f"{label} fill={fill}"
+                                })
+                    ret_all.append(ret)
+
+                # Save results to output directory
+                out_path = Path(f"{base_cfg.output}/{data_name}/{algo_name}/ingest-{scale}-{timestamp}.yaml")
+                out_path.parent.mkdir(exist_ok=True, parents=True)
+                with out_path.open("wt") as f:
+                    yaml.dump(ret_all, f)
+
+        # Save the throughput against batch size curves to the image directory
+        for op in ingest.ops:
+            if len(lines[op]) == 0:
+                continue
+            log.info(f"Writing {data_name} {op} plot to {img.resolve()}")
+            draw_loglog(lines=lines[op], xlabel="batch size (samples)", ylabel=f"{op} throughput (samples/sec)", title=f"Ingest scaling {data_name}",
+                filename=img / f"ingest-{op}-{data_name}-{timestamp}.png", with_ctrl=False, with_error=False, width=10, height=8)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# File and data handling
+from omegaconf import DictConfig, OmegaConf
+import logging
+from pathlib import Path
+import yaml
+import numpy as np
+from datetime import datetime
+# Internal functions
+from dyann.algo.proxy import instantiate_algorithm
+from dyann.data.proxy import instantiate_dataset
+from dyann.pool import QueryPool
+from dyann.util import stringify_dict
+from dyann.vis import draw_loglog
+from run import pregenerate
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/pool.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.load(cfg_path)
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+    timestamp = f"{datetime.now().strftime('%y-%m-%d-%H-%M-%S')}"
+    img = Path(base_cfg.img_out)
+    img.mkdir(exist_ok=True, parents=True)  # Make sure the img directory exists
+    pool_cfg = base_cfg.pool
+
+    # Sweep datasets
+    for data_name in base_cfg.data:
+        lines = []
+        # Sweep algorithms
+        for algo_name in base_cfg.algo:
+            # Instantiate a search algorithm class
+            cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_build.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+                continue
+            algo_cfg = OmegaConf.create(base_cfg)
+            algo_cfg.algo = {}
+            algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+            algo = instantiate_algorithm(cfg=algo_cfg)
+            cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_search.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+                continue
+            algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+            # Instantiate a dataset class
+            cfg_path = Path(".").joinpath(f"conf/data/{data_name}.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping dataset {data_name} - no config at {cfg_path}")
+                continue
+            data_cfg = OmegaConf.create(algo_cfg)
+            data_cfg.data = {}
+            data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
+            # Sweep dataset scale parameters
+            for scale in data_cfg.data.scale:
+                scale_cfg = OmegaConf.create(data_cfg)
+                scale_cfg.data.scale = scale
+                dataset = instantiate_dataset(cfg=scale_cfg)
+                # Download the dataset files, recall is not measured so no groundtruth is generated
+                pregen_cfg = OmegaConf.create(scale_cfg)
+                pregen_cfg.groundtruth = False
+                pregenerate(dataset=dataset, scale_cfg=pregen_cfg)
+                base_vecs = dataset.vecs_base()
+                base_size = base_vecs.shape[0]
+                query_vecs = np.ascontiguousarray(dataset.vecs_query()[base_size:])
+                query_vecs = query_vecs[np.arange(pool_cfg.queries) % query_vecs.shape[0]]
+                # Sweep algorithm build parameters
+                ret_all = []
+                for build in data_cfg.algo.build:
+                    build_cfg = OmegaConf.create(scale_cfg)
+                    build_cfg.algo.build = build
+                    # Build the index
+                    log.info(f"Start to build with {build}")
+                    algo.init(D = base_vecs.shape[1], maxN = base_size * 2, cfg = build_cfg)
+                    if algo.has_train():
+                        log.info("Start to train")
+                        algo.train(vecs=dataset.vecs_train())
+                    log.info("Start to add")
+                    algo.add_chunks(vecs=base_vecs, start = 0, count = base_size, chunk = base_cfg.get("chunk"))
+                    memory_base = algo.get_memory_usage(base_cfg.mem_type)
+                    # Sweep algorithm search parameters
+                    ret = []
+                    for query in build_cfg.algo.query:
+                        query_cfg = OmegaConf.create(build_cfg)
+                        query_cfg.algo.query = query
+                        points = []
+                        for replicas in pool_cfg.replicas:
+                            # Fork the replicas of the built index and search all queries
+                            log.info(f"Start to search with {query} on {replicas} replicas")
+                            pool = QueryPool(algo=algo, replicas=replicas)
+                            memory_start = pool.memory()
+                            _, latency, elapsed = pool.run(vecs=query_vecs, topk=base_cfg.topk, cfg=query_cfg, batch=pool_cfg.batch)
+                            memory_end = pool.memory()
+                            pool.close()
+                            # Pages copied on write while searching are the memory cost of each extra replica
+                            growth = [end["uss"] - start["uss"] for start, end in zip(memory_start, memory_end)]
+                            points.append({
+                                "replicas": int(replicas),
+                                "throughput": float(query_vecs.shape[0] / elapsed),
+                                "latency_p50": float(np.percentile(latency, 50) / pool_cfg.batch),
+                                "latency_p99": float(np.percentile(latency, 99) / pool_cfg.batch),
+                                "rss_replica": [int(m["rss"]) for m in memory_end],
+                                "uss_replica": [int(m["uss"]) for m in memory_end],
+                                "uss_growth_per_replica": float(np.mean(growth)),
+                                "uss_growth_per_replica_per_base": float(np.mean(growth) / base_size)
+                            })
+                            log.info(f"{points[-1]['throughput']:.1f} queries/sec, {np.mean(growth) / 2**20:.2f} MiB copied per replica")
+                        for point in points:
+                            point["speedup"] = point["throughput"] / points[0]["throughput"] * points[0]["replicas"]
+                        ret.append({
+                            "param_build": dict(build),
+                            "param_query": dict(query),
+                            "param_pool": OmegaConf.to_container(pool_cfg),
+                            "memory_base": float(memory_base),
+                            "replicas": points
+                        })
+                        lines.append({
+                            "xs": [p["replicas"] for p in points], "ys": [p["throughput"] for p in points],
+                            "ctrls": [p["replicas"] for p in points], "ctrl_label": "replicas",
+                            "label": f"{algo_name}-{scale}(" + stringify_dict(d=dict(build)) + ", " + stringify_dict(d=dict(query)) + ")"
+                        })
+                        log.info("Finish")
+                    ret_all.append(ret)
+
+                # Save results to output directory
+                out_path = Path(f"{base_cfg.output}/{data_name}/{algo_name}/pool-{scale}-{timestamp}.yaml")
+                out_path.parent.mkdir(exist_ok=True, parents=True)
+                with out_path.open("wt") as f:
+                    yaml.dump(ret_all, f)
+
+        if len(lines) == 0:
+            continue
+        # Save the throughput against replica count curves to the image directory
+        log.info(f"Writing {data_name} plot to {img.resolve()}")
+        draw_loglog(lines=lines, xlabel="replicas", ylabel="throughput (query/sec)", title=f"Replicated query pool {data_name}",
+            filename=img / f"pool-{data_name}-{timestamp}.png", with_ctrl=False, with_error=False, width=10, height=8)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from omegaconf import DictConfig, OmegaConf
+import logging
+import sys
+from pathlib import Path
+import yaml
+import numpy as np
+from dyann.util import stringify_dict
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def load(root, data, algo):
+    """ Group the results of repeated trials by their build and search properties
+
+    Parameters:
+        root: Output directory holding {data}/{algo}/result-*.yaml files
+        data: Dataset name
+        algo: Algorithm name
+    Returns:
+        A dictionary mapping (scale, base size, build, query) strings to the list of results of each trial
+    """
+    trials = {}
+    for p_result in sorted(Path(root).joinpath(data, algo).glob("result-*")):
+        with p_result.open("rt") as f:
+            ret_all = yaml.safe_load(f)
+        for ret in ret_all:
+            for r in ret:
+                # Each scale is written to its own file in the same directory, so only results of one scale are trials
+                key = (str(r.get("scale")), str(r.get("base_size")), stringify_dict(d=r["param_build"]), stringify_dict(d=r["param_query"]))
+                trials.setdefault(key, []).append(r)
+    return trials
+
+def buckets(trials, metric, count, topk):
+    """Split the per-timing or per-query values of each trial into time buckets, keeping the mean of each trial"""
+    means = [[] for _ in range(count)]
+    for r in trials:
+        if metric == "throughput":
+            values = 1.0 / np.array(r["runtime_per_query"])
+        else:
+            values = np.array(r["recall"][0]) / topk
+        for b, chunk in enumerate(np.array_split(values, count)):
+            if len(chunk) > 0:
+                means[b].append(np.mean(chunk))
+    return [np.array(values) for values in means]
+
+def bootstrap(base, cand, metric, resamples, confidence, rng):
+    """ Confidence interval of the change between two sets of trial means by resampling the trials of each independently
+
+    Returns:
+        The observed change and the bounds of its confidence interval, relative for throughput and absolute for recall
+    """
+    base_means = rng.choice(base, size=(resamples, len(base))).mean(axis=1)
+    cand_means = rng.choice(cand, size=(resamples, len(cand))).mean(axis=1)
+    if metric == "throughput":
+        change, changes = np.mean(cand) / np.mean(base) - 1, cand_means / base_means - 1
+    else:
+        change, changes = np.mean(cand) - np.mean(base), cand_means - base_means
+    alpha = (1 - confidence) / 2
+    return float(change), float(np.quantile(changes, alpha)), float(np.quantile(changes, 1 - alpha))
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/compare.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.load(cfg_path)
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+    rng = np.random.default_rng(base_cfg.seed)
+
+    # Compare every configuration found in both result sets
+    report, regressions = [], 0
+    for data_name in base_cfg.data:
+        for algo_name in base_cfg.algo:
+            base_trials = load(base_cfg.baseline, data_name, algo_name)
+            cand_trials = load(base_cfg.candidate, data_name, algo_name)
+            for key in sorted(set(base_trials) | set(cand_trials)):
+                if key not in base_trials or key not in cand_trials:
+                    log.info(f"Skipping {data_name}/{algo_name} scale {key[0]} ({key[2]}, {key[3]}) - only in one result set")
+                    continue
+                if len(base_trials[key]) < 2 or len(cand_trials[key]) < 2:
+                    log.info(f"{data_name}/{algo_name} scale {key[0]} ({key[2]}, {key[3]}) has a single trial, its interval ignores run-to-run noise")
+                for metric in ["throughput", "recall"]:
+                    if metric == "recall" and any(len(r["recall"]) == 0 for r in base_trials[key] + cand_trials[key]):
+                        continue # Run without groundtruth
+                    base = buckets(base_trials[key], metric, base_cfg.buckets, base_cfg.topk)
+                    cand = buckets(cand_trials[key], metric, base_cfg.buckets, base_cfg.topk)
+                    for b in range(base_cfg.buckets):
+                        if len(base[b]) == 0 or len(cand[b]) == 0:
+                            continue
+                        change, lo, hi = bootstrap(base[b], cand[b], metric, base_cfg.resamples, base_cfg.confidence, rng)
+                        # Only flag changes worse than the tolerance across the whole interval
+                        regressed = hi < -base_cfg.tolerance[metric]
+                        regressions = regressions + int(regressed)
+                        report.append({
+                            "data": data_name, "algo": algo_name, "scale": key[0], "base_size": key[1], "param_build": key[2], "param_query": key[3],
+                            "metric": metric, "bucket": b, "trials": [len(base_trials[key]), len(cand_trials[key])],
+                            "change": change, "ci": [lo, hi], "regression": bool(regressed)
+                        })
+                        if regressed:
+                            log.info(f"Regression in {metric} of {data_name}/{algo_name} scale {key[0]} ({key[2]}, {key[3]}) bucket {b}: {change:+.4f} [{lo:+.4f}, {hi:+.4f}]")
+
+    # Save the comparison table
+    log.info(f"Compared {len(report)} buckets, {regressions} regressions")
+    if base_cfg.report is not None:
+        out_path = Path(base_cfg.report)
+        out_path.parent.mkdir(exist_ok=True, parents=True)
+        with out_path.open("wt") as f:
+            yaml.dump(report, f)
+    if regressions > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,11 @@ import annoy
 class AnnoyANN(BaseANN):
     def __init__(self):
         super().__init__()
-        self.n_trees, self.index = None, None
+        self.D, self.n_trees, self.index = None, None, None
 
     def init(self, D, maxN, cfg):
         super().init(D=D, maxN=maxN, cfg=cfg)
+        self.D = D
         self.n_trees = cfg.algo.build.n_trees
         self.index = annoy.AnnoyIndex(f=D, metric="euclidean")
 
@@ -18,11 +19,29 @@ class AnnoyANN(BaseANN):
         return False
 
     def do_add(self, vecs, start, count):
-        for n, vec in enumerate(vecs[start:start+count]):
-            self.index.add_item(n + start, vec.tolist())
-        self.index.unbuild()
-        self.index.build(self.n_trees, n_jobs=1)
+        with self.lock.write:
+            for n, vec in enumerate(vecs[start:start+count]):
+                self.index.add_item(n + start - self.expired, vec.tolist())
+            self.index.unbuild()
+            self.index.build(self.n_trees, n_jobs=1)
+
+    def do_remove(self, vecs, start, count):
+        # Annoy cannot delete items, rebuild from the remaining samples
+        with self.lock.write:
+            self.expired = start + count
+            self.index = annoy.AnnoyIndex(f=self.D, metric="euclidean")
+        self.do_add(vecs, self.expired, vecs.shape[0] - self.expired)
 
     def query(self, vecs, topk, cfg):
-        return [self.index.get_nns_by_vector(vector=vec.tolist(), n=topk, search_k=cfg.algo.query.search_k) for vec in vecs]
+        with self.lock.read:
+            return [[self.expired + i for i in self.index.get_nns_by_vector(vector=vec.tolist(), n=topk, search_k=cfg.algo.query.search_k)] for vec in vecs]
 
+    def index_size(self):
+        # Estimated from the node layout, saving the live index would reload it read-only from the saved file.
+        # Euclidean nodes hold a descendant count, an offset, two children and the vector, and the leaf buckets
+        # of each tree reuse the space of the children and vector for up to D + 2 item ids
+        with self.lock.read:
+            items, trees = self.index.get_n_items(), self.index.get_n_trees()
+        node = 16 + 4 * self.D
+        nodes = trees * 2 * -(-items // (self.D + 2)) # Split and bucket nodes of each tree
+        return {"vectors": items * self.D * 4, "nodes": items * (node - self.D * 4) + nodes * node, "serialized": (items + nodes) * node}
@@ -4,6 +4,9 @@ import gc
 import tracemalloc
 import resource
 import subprocess
+import time
+from ..util import ReadWriteLock
+from .flush import AdaptiveFlush
 
 class BaseANN(object):
     """ Base class for all ANN algorithms
@@ -11,7 +14,10 @@ class BaseANN(object):
     Defined Methods:
         get_memory_usage: helper function for memory footprint monitoring
         add: manage build latency when adding samples
+        add_chunks: add samples with several do_add calls of bounded size
         update: manage build latency when updating samples
+        remove: manage build latency when removing the oldest samples
+        queried: record the time the dataset spent on a query, used to choose flush points when skips is auto
     Inherited Methods:
         __init__: (optional) initialise internal parameters
         init: (optional) initialise the algorithm for a particular dataset
@@ -19,7 +25,14 @@ class BaseANN(object):
         train: (optional) train algorithm parameters on a training set
         do_add: add samples to the algorithms index
         do_update: (optional) update samples in the algorithms index
+        do_remove: (optional) remove the oldest samples from the algorithms index
         query: search for ANNs using the algorithms index
+        index_size: (optional) bytes used by each part of the algorithms index
+        finish: (optional) complete outstanding work once the dataset has been evaluated
+        snapshot: (optional) serialize the index so that a larger base set can be appended to a copy of it
+        restore: (optional) replace the index with a snapshot, after init
+    Attributes:
+        stats: additional measurements reported with the results, eg. flush points chosen when skips is auto
     """
 
     def get_memory_usage(self, type):
@@ -31,6 +44,8 @@ class BaseANN(object):
             return psutil.Process(os.getpid()).memory_info().vms
         if type == "psu_shr":
             return psutil.Process(os.getpid()).memory_info().shared
+        if type == "psu_uss":
+            return psutil.Process(os.getpid()).memory_full_info().uss # Excludes pages shared with other processes, eg. served datasets
         if type == "res_rss":
             return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
         if type == "ps_rss":
@@ -52,10 +67,22 @@ class BaseANN(object):
 
     def __init__(self):
         self.skip_count, self.skip_limit = None, None
+        self.remove_count, self.expired = None, None
+        self.lock = ReadWriteLock() # Guards the index when queried and updated from separate threads
+        self.flush, self.stats = None, {}
 
     def init(self, D, maxN, cfg):
         self.skip_count = 0
-        self.skip_limit = int(maxN * cfg.algo.build.skips)
+        self.flush, self.stats = None, {}
+        if cfg.algo.build.skips == "auto":
+            # Choose the number of delayed events from the measured costs, see AdaptiveFlush
+            self.flush = AdaptiveFlush(maxN=maxN, staleness=cfg.algo.build.get("staleness", 0.1))
+            self.skip_limit = 0
+            self.stats["flush_points"] = self.flush.points
+        else:
+            self.skip_limit = int(maxN * cfg.algo.build.skips)
+        self.remove_count = 0
+        self.expired = 0 # Samples below this index have been removed
 
     def has_train(self):
         pass
@@ -66,31 +93,96 @@ class BaseANN(object):
     def add(self, vecs, start, count):
         """Manage build latency when adding samples"""
         self.skip_count = self.skip_count + count
+        if self.flush is not None:
+            self.skip_limit = self.flush.arrive(count, start + count - self.skip_count)
         if self.skip_count <= self.skip_limit:
+            if self.flush is not None:
+                self.flush.depart()
             return # Delay the add events until threshold is met
         batch_start = max(start + count - self.skip_count, 0)
         batch_count = min(self.skip_count, vecs.shape[0])
         # Add samples
+        t0 = time.perf_counter()
         self.do_add(vecs, batch_start, batch_count)
+        if self.flush is not None:
+            self.flush.observe(batch_count, time.perf_counter() - t0, start + count)
+            self.flush.depart()
         self.skip_count = 0
 
+    def queried(self, seconds):
+        """Record the time spent on a query between add or update events"""
+        if self.flush is not None:
+            self.flush.query(seconds)
+
     def do_add(self, vecs, start, count):
         pass
 
+    def add_chunks(self, vecs, start, count, chunk):
+        """ Add samples with do_add in chunks, so each call only converts a bounded number of rows
+
+        Parameters:
+            vecs: Matrix of samples, eg. mapped by dyann.data.shared.fvecs_load, do_add converts only the rows of its call
+            start: Index of the first sample added
+            count: Number of samples added
+            chunk: Number of samples passed to each call, or None to add them in one call
+        """
+        chunk = chunk or max(count, 1)
+        for s in range(start, start + count, chunk):
+            self.do_add(vecs[:min(s + chunk, start + count)], s, min(chunk, start + count - s))
+
     def update(self, vecs, start, count):
         """Manage build latency when updating samples"""
         self.skip_count = self.skip_count + count
-        if self.skip_count <= 20 * self.skip_limit:
+        limit = 20 * self.skip_limit
+        if self.flush is not None:
+            limit = self.flush.arrive(count, vecs.shape[0])
+        if self.skip_count <= limit:
+            if self.flush is not None:
+                self.flush.depart()
             return # Delay the update events until threshold is met
         batch_start = max(start + count - self.skip_count, 0)
         batch_count = min(self.skip_count, vecs.shape[0])
         # Apply updates
+        t0 = time.perf_counter()
         self.do_update(vecs, batch_start, batch_count)
+        if self.flush is not None:
+            self.flush.observe(batch_count, time.perf_counter() - t0, start + count)
+            self.flush.depart()
         self.skip_count = 0
 
     def do_update(self, vecs, start, count):
         self.do_add(vecs, start, count)
 
+    def remove(self, vecs, start, count):
+        """Manage build latency when removing the oldest samples"""
+        self.remove_count = self.remove_count + count
+        if self.remove_count <= self.skip_limit:
+            return # Delay the remove events until threshold is met
+        batch_start = max(start + count - self.remove_count, self.expired)
+        batch_count = start + count - batch_start
+        # Remove samples
+        self.do_remove(vecs, batch_start, batch_count)
+        self.remove_count = 0
+
+    def do_remove(self, vecs, start, count):
+        # Fallback for indices without deletion, rebuild from the remaining samples
+        self.expired = start + count
+        self.do_update(vecs, self.expired, vecs.shape[0] - self.expired)
+
     def query(self, vecs, topk, cfg):
         pass
 
+    def finish(self):
+        pass
+
+    def index_size(self):
+        """Return the bytes used by each part of the index, independent of the process memory usage"""
+        return {}
+
+    def snapshot(self):
+        """Return the index serialized as a uint8 array, or None if further samples cannot be appended to it"""
+        return None
+
+    def restore(self, state):
+        pass
+
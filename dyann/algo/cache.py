@@ -0,0 +1,158 @@
+from .wrapper import WrapperANN
+import numpy as np
+import threading
+import time
+from collections import OrderedDict
+
+# Consecutive queries in the lerp modes are near-duplicates, so their result sets can be reused.
+# Queries are keyed by a random hyperplane signature, a cached entry is reused when the query has drifted from the
+# cached query by less than a tolerance of its k-th neighbour distance, and its candidates are re-ranked exactly.
+
+class CacheANN(WrapperANN):
+    params = ["bits", "tolerance", "cache_mb"]
+
+    def __init__(self):
+        super().__init__()
+        self.bits, self.tolerance, self.capacity = None, None, None
+        self.planes, self.vecs, self.mutex = None, None, threading.Lock()
+        self.entries, self.owners, self.slots = None, None, None
+        self.centres, self.radii, self.ids, self.free = None, None, None, None
+        self.overhead, self.search_time = None, None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.bits = cfg.algo.build.bits
+        self.tolerance = cfg.algo.build.tolerance
+        self.capacity = int(cfg.algo.build.cache_mb * 2**20)
+        self.planes = np.random.default_rng(0).standard_normal([self.bits, D]).astype('float32')
+        self.vecs = None
+        self.entries = OrderedDict() # Signature to slot, least recently used first
+        self.owners = {} # Sample id to the slots holding it as a candidate
+        self.slots = None # Allocated on the first query, once topk is known
+        self.overhead, self.search_time = 0.0, 0.0
+        self.stats.update({"cache_hits": 0, "cache_misses": 0, "cache_invalidations": 0, "cache_hit_rate": 0.0, "cache_saved": 0.0})
+
+    def allocate(self, D, topk):
+        # Approximate bytes per entry, the centre, candidates, signature and id index entries
+        size = 4 * D + 8 * topk + 64 * topk + 256
+        count = max(self.capacity // size, 1)
+        self.centres = np.zeros([count, D]).astype('float32')
+        self.radii = -1 * np.ones([count]).astype('float32') # Negative for free slots
+        self.ids = -1 * np.ones([count, topk]).astype('int64')
+        self.slots = [None] * count # Signature of the entry held by each slot
+        self.free = list(range(count - 1, -1, -1))
+
+    def index_size(self):
+        sizes = super().index_size()
+        if self.slots is not None:
+            sizes["cache"] = self.centres.nbytes + self.radii.nbytes + self.ids.nbytes
+        return sizes
+
+    def signature(self, vecs):
+        return [row.tobytes() for row in np.packbits(vecs @ self.planes.T > 0, axis=1)]
+
+    def evict(self, slot):
+        key = self.slots[slot]
+        self.entries.pop(key, None)
+        for id in self.ids[slot]:
+            if id >= 0:
+                owners = self.owners.get(int(id))
+                if owners is not None:
+                    owners.discard(slot)
+                    if len(owners) == 0:
+                        self.owners.pop(int(id))
+        self.slots[slot], self.radii[slot], self.ids[slot] = None, -1, -1
+        self.free.append(slot)
+
+    def invalidate(self, vecs, start, count, moved=True):
+        """Evict entries holding the given samples and, if they moved, entries whose neighbourhood they now fall in"""
+        if self.slots is None or len(self.entries) == 0:
+            return
+        with self.mutex:
+            stale = set()
+            for id in range(start, start + count):
+                stale.update(self.owners.get(id, ()))
+            used = np.flatnonzero(self.radii >= 0)
+            if len(used) > 0 and moved:
+                rows = np.asarray(vecs[start:start+count], dtype='float32')
+                dists = np.sum(rows ** 2, axis=1)[:,None] - 2 * rows @ self.centres[used].T + np.sum(self.centres[used] ** 2, axis=1)[None,:]
+                reach = ((1 + 2 * self.tolerance) * np.sqrt(self.radii[used])) ** 2
+                stale.update(used[np.any(dists < reach[None,:], axis=0)].tolist())
+            for slot in stale:
+                self.evict(slot)
+            self.stats["cache_invalidations"] = self.stats["cache_invalidations"] + len(stale)
+
+    def do_add(self, vecs, start, count):
+        super().do_add(vecs, start, count)
+        self.vecs = vecs
+        self.invalidate(vecs, start, count)
+
+    def do_update(self, vecs, start, count):
+        super().do_update(vecs, start, count)
+        self.vecs = vecs
+        self.invalidate(vecs, start, count)
+
+    def do_remove(self, vecs, start, count):
+        super().do_remove(vecs, start, count)
+        self.vecs = vecs
+        self.invalidate(vecs, start, count, moved=False)
+
+    def query(self, vecs, topk, cfg):
+        t0 = time.perf_counter()
+        vecs = np.asarray(vecs, dtype='float32')
+        if self.slots is None or self.ids.shape[1] != topk:
+            self.allocate(vecs.shape[1], topk)
+        keys = self.signature(vecs)
+        ids = -1 * np.ones([vecs.shape[0], topk]).astype('int64')
+        # Re-rank the cached candidates of queries close enough to a cached query
+        hits = []
+        with self.mutex:
+            for q, key in enumerate(keys):
+                slot = self.entries.get(key)
+                if slot is None or self.vecs is None:
+                    continue
+                drift = np.sum((vecs[q] - self.centres[slot]) ** 2)
+                if drift > self.tolerance ** 2 * self.radii[slot]:
+                    continue
+                candidates = self.ids[slot][(self.ids[slot] >= self.expired) & (self.ids[slot] >= 0)]
+                dists = np.sum((np.asarray(self.vecs[candidates], dtype='float32').reshape(len(candidates), -1) - vecs[q]) ** 2, axis=1)
+                ids[q,:len(candidates)] = candidates[np.argsort(dists, kind="stable")]
+                self.entries.move_to_end(key)
+                hits.append(q)
+        misses = np.setdiff1d(np.arange(vecs.shape[0]), hits)
+        # Search the wrapped index for the remaining queries and cache their results
+        t1 = time.perf_counter()
+        if len(misses) > 0:
+            found = np.array(super().query(vecs[misses], topk, cfg)).astype('int64').reshape(len(misses), -1)[:,:topk]
+            ids[misses,:found.shape[1]] = found
+        t2 = time.perf_counter()
+        if len(misses) > 0 and self.vecs is not None:
+            with self.mutex:
+                for q, row in zip(misses, ids[misses]):
+                    self.insert(keys[q], vecs[q], row)
+        # Latency saved is the mean search time of the avoided searches, less the time spent in the cache
+        self.overhead = self.overhead + (t1 - t0) + (time.perf_counter() - t2)
+        self.search_time = self.search_time + (t2 - t1)
+        self.stats["cache_hits"] = self.stats["cache_hits"] + len(hits)
+        self.stats["cache_misses"] = self.stats["cache_misses"] + len(misses)
+        self.stats["cache_hit_rate"] = self.stats["cache_hits"] / (self.stats["cache_hits"] + self.stats["cache_misses"])
+        if self.stats["cache_misses"] > 0:
+            self.stats["cache_saved"] = self.stats["cache_hits"] * self.search_time / self.stats["cache_misses"] - self.overhead
+        return ids
+
+    def insert(self, key, vec, row):
+        valid = row[row >= 0]
+        if len(valid) == 0:
+            return
+        if key in self.entries:
+            self.evict(self.entries[key])
+        if len(self.free) == 0:
+            self.evict(next(iter(self.entries.values()))) # Least recently used
+        slot = self.free.pop()
+        self.centres[slot] = vec
+        self.radii[slot] = np.max(np.sum((np.asarray(self.vecs[valid], dtype='float32').reshape(len(valid), -1) - vec) ** 2, axis=1))
+        self.ids[slot] = row
+        self.slots[slot] = key
+        self.entries[key] = slot
+        for id in valid:
+            self.owners.setdefault(int(id), set()).add(slot)
@@ -0,0 +1,101 @@
+from .ivfpq import IvfpqANN
+from ..util import rerank
+import numpy as np
+import faiss
+import mmap
+import os
+import resource
+import tempfile
+import weakref
+
+# IVFPQ codes stay in memory while the full vectors are appended to a file mapped into memory, so only the rows
+# of the shortlisted candidates are paged in to re-rank them and the resident size is bounded by the codes.
+# Refer to https://github.com/facebookresearch/faiss/wiki/Indexes-that-do-not-fit-in-RAM
+
+# Page faults of the calling thread only, so concurrent writers are not counted against queries
+RUSAGE = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+class DiskIvfANN(IvfpqANN):
+    def __init__(self):
+        super().__init__()
+        self.path, self.rows, self.finalizer, self.drop_cache = None, None, None, False
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        if self.finalizer is not None:
+            self.rows = None
+            self.finalizer() # Delete the file of the previous build
+        fd, self.path = tempfile.mkstemp(prefix="dyann-", suffix=".f32", dir=cfg.algo.build.get("path", None))
+        os.close(fd)
+        self.finalizer = weakref.finalize(self, os.remove, self.path)
+        self.drop_cache = cfg.algo.build.get("drop_cache", False)
+        self.grow(maxN)
+        self.stats.update({"disk_queries": 0, "disk_rows_read": 0, "disk_bytes_read": 0, "disk_faults_minor": 0, "disk_faults_major": 0,
+                           "disk_bytes_per_query": 0.0, "disk_faults_minor_per_query": 0.0, "disk_faults_major_per_query": 0.0})
+
+    def grow(self, rows):
+        """Extend the vector file to hold the given number of rows and map it again"""
+        self.rows = None # Release the previous mapping first
+        with open(self.path, "r+b") as f:
+            f.truncate(rows * self.index.d * 4) # Sparse, blocks are only allocated when written
+        self.rows = np.memmap(self.path, dtype='float32', mode='r+', shape=(rows, self.index.d))
+
+    def store(self, vecs, start, count):
+        with self.lock.write:
+            if start + count > self.rows.shape[0]:
+                self.grow(max(start + count, 2 * self.rows.shape[0]))
+            self.rows[start:start+count] = vecs[start:start+count]
+            if self.drop_cache:
+                self.drop(start, count)
+
+    def drop(self, start, count):
+        """Write back the given rows and drop their pages from memory, so queries read them from disk as when the file exceeds RAM"""
+        first = start * self.index.d * 4 // mmap.PAGESIZE * mmap.PAGESIZE # Aligned down, sharing a page with earlier rows only costs a re-read
+        length = (start + count) * self.index.d * 4 - first
+        self.rows.flush()
+        if hasattr(mmap, "MADV_DONTNEED"):
+            self.rows._mmap.madvise(mmap.MADV_DONTNEED, first, length) # Unmap from this process
+        if hasattr(os, "POSIX_FADV_DONTNEED"):
+            with open(self.path, "rb") as f:
+                os.posix_fadvise(f.fileno(), first, length, os.POSIX_FADV_DONTNEED) # Evict the clean pages from the page cache
+
+    def do_add(self, vecs, start, count):
+        self.store(vecs, start, count)
+        super().do_add(vecs, start, count)
+
+    def do_update(self, vecs, start, count):
+        self.store(vecs, start, count)
+        with self.lock.write:
+            self.index.remove_ids(faiss.IDSelectorRange(start, start+count))
+            self.index.add_with_ids(vecs[start:start+count,:], np.array(range(start, start+count)))
+
+    def lookup(self, row):
+        self.stats["disk_rows_read"] = self.stats["disk_rows_read"] + len(row)
+        return self.rows[row]
+
+    def query(self, vecs, topk, cfg):
+        with self.lock.read:
+            self.index.nprobe = cfg.algo.query.nprobe
+            _, candidates = self.index.search(x=vecs, k=topk * cfg.algo.query.get("rerank", 4))
+            # Re-rank by the full vectors, faults while reading the candidate rows are the disk reads of this query
+            before = resource.getrusage(RUSAGE)
+            ids = rerank(vecs, candidates, self.lookup, topk)
+            after = resource.getrusage(RUSAGE)
+        stats = self.stats
+        stats["disk_queries"] = stats["disk_queries"] + len(vecs)
+        stats["disk_bytes_read"] = stats["disk_rows_read"] * self.index.d * 4
+        stats["disk_faults_minor"] = stats["disk_faults_minor"] + after.ru_minflt - before.ru_minflt
+        stats["disk_faults_major"] = stats["disk_faults_major"] + after.ru_majflt - before.ru_majflt
+        stats["disk_bytes_per_query"] = stats["disk_bytes_read"] / stats["disk_queries"]
+        stats["disk_faults_minor_per_query"] = stats["disk_faults_minor"] / stats["disk_queries"]
+        stats["disk_faults_major_per_query"] = stats["disk_faults_major"] / stats["disk_queries"]
+        return ids
+
+    def index_size(self):
+        sizes = super().index_size()
+        with self.lock.read:
+            sizes["disk_vectors"] = os.stat(self.path).st_blocks * 512 # Allocated blocks of the sparse file
+        return sizes
+
+    def snapshot(self):
+        return None # The vector file is rewritten by each build
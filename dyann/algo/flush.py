@@ -0,0 +1,76 @@
+import time
+import numpy as np
+from collections import deque
+
+class AdaptiveFlush(object):
+    """ Cost model choosing how many delayed events to collect before flushing them into an index
+
+    Flushing n pending samples is modelled as costing a + b*n seconds, fitted to the flushes observed so far.
+    Pending samples are invisible to queries, which is penalised as the cost of scanning them exhaustively:
+    each driver event with p pending samples costs query_time * p / N, where query_time is the time spent on
+    queries during the event and N is the number of indexed samples. A driver event groups the calls to add or
+    update between two queries, eg. the updates of one featlearn batch, with the query time reported by the dataset.
+    When no queries are reported each call is an event, and the time until the next call is taken as query time.
+    Flushing every n samples arriving c per event then costs (a + b*n)/n + query_time*n / (2*c*N) per sample,
+    minimised at n = sqrt(2*a*c*N / query_time), which is capped by the staleness bound.
+
+    Attributes:
+        bound: Maximum number of pending samples
+        decay: Weight of older flush observations in the cost fit
+        limit: Current number of pending samples tolerated before flushing
+        points: Sample index at each flush
+    """
+
+    def __init__(self, maxN, staleness, decay=0.9):
+        self.bound = int(maxN * staleness)
+        self.decay = decay
+        self.limit = 0 # Flush immediately until a cost has been observed
+        self.points = []
+        self.fit = np.zeros([5]) # Decayed sums of 1, n, t, n^2, n*t
+        self.events = deque(maxlen=64) # Samples arriving and seconds spent on queries in recent driver events
+        self.samples, self.queried, self.reported = 0, 0.0, False
+        self.last = None
+
+    def query(self, seconds):
+        """Record the time spent on a query, queries delimit the driver events"""
+        self.queried = self.queried + seconds
+        self.reported = True
+
+    def arrive(self, count, indexed):
+        """Record the arriving samples and return the number of pending samples to tolerate"""
+        now = time.perf_counter()
+        if self.reported:
+            # Close the event once a query has run since its first arrival
+            if self.queried > 0:
+                if self.samples > 0:
+                    self.events.append((self.samples, self.queried))
+                self.samples, self.queried = 0, 0.0
+        elif self.last is not None:
+            self.events.append((self.samples, now - self.last))
+            self.samples = 0
+        self.samples = self.samples + count
+        if len(self.events) > 0 and self.fit[0] > 0:
+            a, _ = self.cost()
+            samples = max(float(np.median([e[0] for e in self.events])), 1.0)
+            query_time = max(float(np.median([e[1] for e in self.events])), 1e-9)
+            self.limit = int(min(np.sqrt(2 * a * samples * max(indexed, 1) / query_time), self.bound))
+        return self.limit
+
+    def depart(self):
+        """Mark the end of a call, without reported queries the time until the next one is spent on queries"""
+        self.last = time.perf_counter()
+
+    def observe(self, count, seconds, point):
+        """Record the cost of flushing a number of pending samples"""
+        self.fit = self.decay * self.fit + np.array([1, count, seconds, count * count, count * seconds])
+        self.points.append(int(point))
+
+    def cost(self):
+        """Fixed and per sample flush cost fitted by weighted least squares"""
+        w, n, t, nn, nt = self.fit
+        det = w * nn - n * n
+        if det <= 1e-12 * max(w * nn, 1e-12):
+            return t / w, 0.0 # Flush sizes too similar to separate the fixed cost
+        b = max((w * nt - n * t) / det, 0.0)
+        a = max((t - b * n) / w, 0.0)
+        return a, b
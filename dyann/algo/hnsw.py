@@ -1,5 +1,7 @@
 from .base import BaseANN
 import numpy as np
+import os
+import tempfile
 import hnswlib
 
 # Refer to https://github.com/nmslib/hnswlib/blob/master/README.md
@@ -17,21 +19,61 @@ class HnswANN(BaseANN):
         self.maxN = maxN
         self.index = hnswlib.Index(space='l2', dim=D)
         self.index.set_num_threads(1)
-        self.index.init_index(max_elements=self.maxN, ef_construction=self.ef_construction, M=self.M)
+        self.index.init_index(max_elements=self.maxN, ef_construction=self.ef_construction, M=self.M, allow_replace_deleted=True)
 
     def has_train(self):
         return False
 
     def do_add(self, vecs, start, count):
-        self.index.add_items(data=vecs[start:start+count,:], ids=np.array(range(start, start+count)))
+        # hnswlib allows searches during inserts, but not while deleted slots are being replaced
+        lock = self.lock.write if self.expired > 0 else self.lock.read
+        with lock:
+            self.index.add_items(data=vecs[start:start+count,:], ids=np.array(range(start, start+count)), replace_deleted=True)
+
+    def do_remove(self, vecs, start, count):
+        # Tombstone the samples, their slots are reused by later adds
+        with self.lock.write:
+            for label in range(start, start+count):
+                try:
+                    self.index.mark_deleted(label)
+                except RuntimeError:
+                    pass # Sample was never added
+            self.expired = start + count
 
     def query(self, vecs, topk, cfg):
-        self.index.set_num_threads(1)
-        self.index.set_ef(ef=cfg.algo.query.ef)
-        try:
-            labels, _ = self.index.knn_query(data=vecs, k=topk)
-        except RuntimeError:
-            labels = -1 * np.ones([vecs.shape[0], topk])
+        with self.lock.read:
+            self.index.set_num_threads(1)
+            self.index.set_ef(ef=cfg.algo.query.ef)
+            try:
+                labels, _ = self.index.knn_query(data=vecs, k=topk)
+            except RuntimeError:
+                labels = -1 * np.ones([vecs.shape[0], topk])
         return labels
 
+    def index_size(self):
+        # Level 0 holds the links, vector and label of each element in one block, preallocated for maxN elements
+        count, D = self.index.element_count, self.index.dim
+        level0 = 2 * self.M * 4 + 4
+        with self.lock.read, tempfile.TemporaryDirectory() as path:
+            self.index.save_index(os.path.join(path, "index.bin"))
+            serialized = os.path.getsize(os.path.join(path, "index.bin"))
+        return {
+            "vectors": count * D * 4,
+            "labels": count * 8,
+            "level0_links": count * level0,
+            "upper_links": max(serialized - 96 - count * (level0 + D * 4 + 8 + 4), 0), # Less the header and level sizes
+            "allocated": self.maxN * (level0 + D * 4 + 8),
+            "serialized": serialized
+        }
 
+    def snapshot(self):
+        with self.lock.read, tempfile.TemporaryDirectory() as path:
+            self.index.save_index(os.path.join(path, "index.bin"))
+            return np.fromfile(os.path.join(path, "index.bin"), dtype='uint8')
+
+    def restore(self, state):
+        # Loading resizes the index to hold the maxN samples of this instance
+        with tempfile.TemporaryDirectory() as path:
+            state.tofile(os.path.join(path, "index.bin"))
+            self.index.load_index(os.path.join(path, "index.bin"), max_elements=self.maxN, allow_replace_deleted=True)
+        self.index.set_num_threads(1)
@@ -9,6 +9,7 @@ class IvfpqANN(BaseANN):
     def __init__(self):
         super().__init__()
         self.M, self.nlist, self.index = None, None, None
+        self.centroids, self.shortlist = None, None
 
     def init(self, D, maxN, cfg):
         super().init(D=D, maxN=maxN, cfg=cfg)
@@ -16,21 +17,70 @@ class IvfpqANN(BaseANN):
         faiss.omp_set_num_threads(1)  # Make sure this is on a single thread mode
         quantizer = faiss.IndexFlatL2(D)
         self.index = faiss.IndexIVFPQ(quantizer, D, self.nlist, self.M, 8)
+        self.centroids, self.shortlist = None, None # Lists shortlisted for the last query, reused by warm searches
 
     def has_train(self):
         return True
 
     def train(self, vecs):
         self.index.train(vecs)
+        self.centroids = self.index.quantizer.reconstruct_n(0, self.nlist)
 
     def do_add(self, vecs, start, count):
-        self.index.add_with_ids(vecs[start:start+count,:], np.array(range(start, start+count)))
+        with self.lock.write:
+            self.index.add_with_ids(vecs[start:start+count,:], np.array(range(start, start+count)))
+
+    def do_remove(self, vecs, start, count):
+        with self.lock.write:
+            self.index.remove_ids(faiss.IDSelectorRange(start, start+count))
+            self.expired = start + count
 
     def query(self, vecs, topk, cfg):
-        self.index.nprobe = cfg.algo.query.nprobe
-        _, ids = self.index.search(x=vecs, k=topk)
+        with self.lock.read:
+            self.index.nprobe = cfg.algo.query.nprobe
+            if cfg.algo.query.get("warm", False):
+                lists, coarse = self.assign(vecs, self.index.nprobe)
+                _, ids = self.index.search_preassigned(vecs, topk, lists, coarse)
+            else:
+                _, ids = self.index.search(x=vecs, k=topk)
         return ids
 
+    def assign(self, vecs, nprobe):
+        # Rank only the lists shortlisted around the previous query, probing the nearest first, and fall back to
+        # the full coarse quantizer once lists from the far half of the shortlist move into the probed set
+        width = min(4 * nprobe, self.nlist)
+        shortlist = self.shortlist
+        if shortlist is not None and shortlist.shape == (vecs.shape[0], width):
+            coarse = np.sum((self.centroids[shortlist] - vecs[:,None,:]) ** 2, axis=2)
+            order = np.argsort(coarse, axis=1)
+            if not np.any(order[:,:nprobe] >= width // 2):
+                shortlist, coarse = np.take_along_axis(shortlist, order, axis=1), np.take_along_axis(coarse, order, axis=1)
+                self.shortlist = shortlist
+                return shortlist[:,:nprobe], coarse[:,:nprobe].astype('float32')
+        coarse, shortlist = self.index.quantizer.search(vecs, width)
+        self.shortlist = shortlist
+        return shortlist[:,:nprobe], coarse[:,:nprobe]
+
+    def index_size(self):
+        with self.lock.read:
+            invlists = self.index.invlists
+            sizes = [invlists.list_size(l) for l in range(self.nlist)]
+            return {
+                "codes": sum(sizes) * invlists.code_size,
+                "ids": sum(sizes) * 8,
+                "centroids": self.index.quantizer.ntotal * self.index.d * 4,
+                "codebooks": self.index.pq.centroids.size() * 4,
+                "serialized": faiss.serialize_index(self.index).nbytes
+            }
+
+    def snapshot(self):
+        with self.lock.read:
+            return faiss.serialize_index(self.index)
+
+    def restore(self, state):
+        self.index = faiss.deserialize_index(state)
+        self.centroids = self.index.quantizer.reconstruct_n(0, self.nlist)
+
 class Ivfpq4bitANN(IvfpqANN):
     def init(self, D, maxN, cfg):
         super().init(D=D, maxN=maxN, cfg=cfg)
@@ -21,11 +21,15 @@ class KDTreeANN(BaseANN):
         return False
 
     def do_add(self, vecs, start, count):
-        self.index = KDTree(vecs[:start+count], leaf_size=self.num_leaves)
+        # The new tree replaces the old one once built, so concurrent queries need no lock
+        self.index = KDTree(vecs[self.expired:start+count], leaf_size=self.num_leaves)
 
     def do_update(self, vecs, start, count):
         self.do_add(vecs, 0, self.maxN)
 
     def query(self, vecs, topk, cfg):
-        return self.index.query(vecs, k=topk, return_distance=False, dualtree=self.dual_tree, breadth_first=self.bfs)
+        return self.expired + self.index.query(vecs, k=topk, return_distance=False, dualtree=self.dual_tree, breadth_first=self.bfs)
 
+    def index_size(self):
+        data, idx_array, node_data, node_bounds = self.index.get_arrays()
+        return {"vectors": data.nbytes, "idx_array": idx_array.nbytes, "node_data": node_data.nbytes, "node_bounds": node_bounds.nbytes}
@@ -1,4 +1,5 @@
 from .base import BaseANN
+import numpy as np
 import faiss
 
 # Refer to https://github.com/facebookresearch/faiss/blob/main/faiss/IndexFlat.h
@@ -7,26 +8,73 @@ import faiss
 class LinearANN(BaseANN):
     def __init__(self):
         super().__init__()
-        self.index = None
+        self.index, self.offset = None, None
 
     def init(self, D, maxN, cfg):
         super().init(D=D, maxN=maxN, cfg=cfg)
         faiss.omp_set_num_threads(1)  # Make sure this is on a single thread mode
         self.index = faiss.IndexFlatL2(D)
+        self.offset = 0 # Samples below this index have been compacted out of the index
 
     def has_train(self):
         return False
 
     def do_add(self, vecs, start, count):
-        self.index.add(vecs[start:start+count])
+        with self.lock.write:
+            self.index.add(vecs[start:start+count])
 
     def do_update(self, vecs, start, count):
-        self.index.reset()
-        self.index.add(vecs)
+        with self.lock.write:
+            self.index.reset()
+            self.index.add(vecs[self.expired:])
+            self.offset = self.expired
+
+    def do_remove(self, vecs, start, count):
+        with self.lock.write:
+            self.expired = start + count
+            # Compact once the expired samples make up half of the index
+            if 2 * (self.expired - self.offset) > self.index.ntotal:
+                self.index.remove_ids(faiss.IDSelectorRange(0, self.expired - self.offset))
+                self.offset = self.expired
 
     def query(self, vecs, topk, cfg):
-        _, ids = self.index.search(x=vecs, k=topk)
+        with self.lock.read:
+            offset = self.offset
+            if self.expired == offset:
+                _, ids = self.index.search(x=vecs, k=topk)
+            else:
+                params = faiss.SearchParameters(sel=faiss.IDSelectorRange(self.expired - offset, self.index.ntotal))
+                _, ids = self.index.search(x=vecs, k=topk, params=params)
+        if offset > 0:
+            ids = np.where(ids < 0, ids, ids + offset)
         return ids
 
+    def snapshot(self):
+        with self.lock.read:
+            return faiss.serialize_index(self.index)
+
+    def restore(self, state):
+        self.index = faiss.deserialize_index(state)
+        self.offset = 0
+
+    def index_size(self):
+        with self.lock.read:
+            return {"codes": self.index.ntotal * self.index.sa_code_size(), "serialized": faiss.serialize_index(self.index).nbytes}
 
+# Refer to https://github.com/facebookresearch/faiss/blob/main/faiss/IndexScalarQuantizer.h
+
+class LinearSQANN(LinearANN):
+    def __init__(self):
+        super().__init__()
+        self.qtype = None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.qtype = cfg.algo.build.qtype # Selected from {fp16, 8bit, 6bit, 4bit}
+        self.index = faiss.IndexScalarQuantizer(D, getattr(faiss.ScalarQuantizer, f"QT_{self.qtype}"), faiss.METRIC_L2)
+
+    def has_train(self):
+        return True
 
+    def train(self, vecs):
+        self.index.train(vecs) # Per-dimension ranges of the quantizer
@@ -0,0 +1,27 @@
+from .base import BaseANN
+import numpy as np
+
+# Every event is a no-op and queries return no neighbours, so evaluating this algorithm times the benchmark
+# harness alone. run.py subtracts these timings from the other algorithms when calibrate is set.
+
+class NoopANN(BaseANN):
+    def __init__(self):
+        super().__init__()
+        self.empty = None
+
+    def has_train(self):
+        return False
+
+    def add(self, vecs, start, count):
+        pass
+
+    def update(self, vecs, start, count):
+        pass
+
+    def remove(self, vecs, start, count):
+        pass
+
+    def query(self, vecs, topk, cfg):
+        if self.empty is None or self.empty.shape != (len(vecs), topk):
+            self.empty = -1 * np.ones([len(vecs), topk]).astype('int64')
+        return self.empty
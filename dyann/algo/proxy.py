@@ -5,7 +5,7 @@ def instantiate_algorithm(cfg):
 
     Parameters:
         cfg: configuration object containing the name of the target algorithm
-                selected from {linear, annoy, ivfpq, hnsw, scann, kdtree}
+                selected from {linear, linear_sq, annoy, ivfpq, hnsw, scann, kdtree, shard, cache, shadow, disk, reduce, rerank, tiered, noop}
     Returns:
         an instance of the specified algorithm class or None object if name is invalid
     """
@@ -13,6 +13,9 @@ def instantiate_algorithm(cfg):
     if cfg.algo.name == "linear":
         from .linear import LinearANN
         return LinearANN()
+    elif cfg.algo.name == "linear_sq":
+        from .linear import LinearSQANN
+        return LinearSQANN()
     elif cfg.algo.name == "annoy":
         from .annoy import AnnoyANN
         return AnnoyANN()
@@ -28,6 +31,30 @@ def instantiate_algorithm(cfg):
     elif cfg.algo.name == "kdtree":
         from .kdtree import KDTreeANN
         return KDTreeANN()
+    elif cfg.algo.name == "shard":
+        from .shard import ShardANN
+        return ShardANN()
+    elif cfg.algo.name == "cache":
+        from .cache import CacheANN
+        return CacheANN()
+    elif cfg.algo.name == "shadow":
+        from .shadow import ShadowANN
+        return ShadowANN()
+    elif cfg.algo.name == "disk":
+        from .disk import DiskIvfANN
+        return DiskIvfANN()
+    elif cfg.algo.name == "reduce":
+        from .reduce import ReduceANN
+        return ReduceANN()
+    elif cfg.algo.name == "rerank":
+        from .rerank import RerankANN
+        return RerankANN()
+    elif cfg.algo.name == "tiered":
+        from .tiered import TieredANN
+        return TieredANN()
+    elif cfg.algo.name == "noop":
+        from .noop import NoopANN
+        return NoopANN()
     else:
         return None
 
@@ -0,0 +1,73 @@
+from .wrapper import WrapperANN
+from ..util import rerank
+import numpy as np
+import faiss
+
+# Samples and queries are rotated and truncated by a PCA or OPQ transform trained on the training set, and the
+# wrapped algorithm indexes the reduced vectors. Candidates can be re-ranked exactly in the original space.
+# Refer to https://github.com/facebookresearch/faiss/blob/main/faiss/VectorTransform.h
+
+class ReduceANN(WrapperANN):
+    params = ["reduce", "dims", "opq_M"]
+
+    def __init__(self):
+        super().__init__()
+        self.transform, self.reduced, self.vecs = None, None, None
+
+    def init(self, D, maxN, cfg):
+        # The wrapped algorithm is built on the reduced dimensions
+        dims = cfg.algo.build.dims
+        super().init(D=dims, maxN=maxN, cfg=cfg)
+        if cfg.algo.build.reduce == "pca":
+            self.transform = faiss.PCAMatrix(D, dims)
+        elif cfg.algo.build.reduce == "opq":
+            self.transform = faiss.OPQMatrix(D, cfg.algo.build.get("opq_M", 8), dims)
+        else:
+            raise ValueError(f"Unknown reduction {cfg.algo.build.reduce}, expected pca or opq")
+        self.reduced = np.zeros([maxN, dims]).astype('float32') # Reduced samples by id, passed to the wrapped algorithm
+        self.vecs = None
+
+    def has_train(self):
+        return True
+
+    def train(self, vecs):
+        vecs = np.ascontiguousarray(vecs, dtype='float32')
+        self.transform.train(vecs)
+        if self.inner.has_train():
+            self.inner.train(self.transform.apply_py(vecs))
+
+    def project(self, vecs, start, count):
+        """Transform the given samples into the reduced matrix, returning the rows up to the end of vecs"""
+        if vecs.shape[0] > self.reduced.shape[0]:
+            self.reduced = np.concatenate([self.reduced, np.zeros([max(vecs.shape[0], 2 * self.reduced.shape[0]) - self.reduced.shape[0], self.reduced.shape[1]]).astype('float32')])
+        for chunk in range(start, start + count, 65536):
+            end = min(chunk + 65536, start + count)
+            self.reduced[chunk:end] = self.transform.apply_py(np.ascontiguousarray(vecs[chunk:end], dtype='float32'))
+        self.vecs = vecs # Original samples, looked up when re-ranking
+        return self.reduced[:vecs.shape[0]]
+
+    def do_add(self, vecs, start, count):
+        self.inner.do_add(self.project(vecs, start, count), start, count)
+
+    def do_update(self, vecs, start, count):
+        self.inner.do_update(self.project(vecs, start, count), start, count)
+
+    def do_remove(self, vecs, start, count):
+        self.inner.do_remove(self.project(vecs, start, 0), start, count)
+        self.expired = self.inner.expired
+
+    def query(self, vecs, topk, cfg):
+        vecs = np.ascontiguousarray(vecs, dtype='float32')
+        factor = cfg.algo.query.get("rerank", 0)
+        if factor == 0:
+            return self.inner.query(self.transform.apply_py(vecs), topk, cfg)
+        # Search for more candidates in the reduced space and keep the nearest in the original space
+        candidates = np.array(self.inner.query(self.transform.apply_py(vecs), topk * factor, cfg)).astype('int64')
+        with self.lock.read:
+            return rerank(vecs, candidates, lambda ids: self.vecs[ids], topk)
+
+    def index_size(self):
+        sizes = super().index_size()
+        sizes["transform"] = (self.transform.d_in + 1) * self.transform.d_out * 4 # Matrix and bias
+        sizes["reduced"] = self.reduced.nbytes
+        return sizes
@@ -0,0 +1,40 @@
+from .wrapper import WrapperANN
+from ..util import rerank
+import numpy as np
+
+# The wrapped algorithm is asked for alpha times topk candidates, whose full precision vectors are gathered from a
+# contiguous store and compared with the queries in one batch, so compressed indices can trade speed for recall.
+
+class RerankANN(WrapperANN):
+    def __init__(self):
+        super().__init__()
+        self.store = None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.store = np.zeros([maxN, D]).astype('float32') # Full precision samples by id
+
+    def keep(self, vecs, start, count):
+        with self.lock.write:
+            if start + count > self.store.shape[0]:
+                self.store = np.concatenate([self.store, np.zeros([max(start + count, 2 * self.store.shape[0]) - self.store.shape[0], self.store.shape[1]]).astype('float32')])
+            self.store[start:start+count] = np.asarray(vecs[start:start+count], dtype='float32')
+
+    def do_add(self, vecs, start, count):
+        self.keep(vecs, start, count)
+        super().do_add(vecs, start, count)
+
+    def do_update(self, vecs, start, count):
+        self.keep(vecs, start, count)
+        super().do_update(vecs, start, count)
+
+    def query(self, vecs, topk, cfg):
+        alpha = cfg.algo.query.get("alpha", 1)
+        candidates = self.inner.query(vecs, max(int(np.ceil(topk * alpha)), topk), cfg)
+        with self.lock.read:
+            return rerank(vecs, candidates, lambda ids: self.store[ids], topk)
+
+    def index_size(self):
+        sizes = super().index_size()
+        sizes["store"] = self.store.nbytes
+        return sizes
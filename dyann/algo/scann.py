@@ -1,4 +1,6 @@
 from .base import BaseANN
+import os
+import tempfile
 import scann
 
 # Some hypter-parameters are from https://github.com/facebookresearch/faiss/blob/master/benchs/bench_all_ivf/cmp_with_scann.py
@@ -21,16 +23,16 @@ class ScannANN(BaseANN):
         return False
 
     def do_add(self, vecs, start, count):
-        sb = scann.scann_ops_pybind.builder(db=vecs[:start+count], num_neighbors=10, distance_measure="squared_l2")
+        sb = scann.scann_ops_pybind.builder(db=vecs[self.expired:start+count], num_neighbors=10, distance_measure="squared_l2")
         sb.set_n_training_threads(1)
-        sb.tree(num_leaves=self.num_leaves, num_leaves_to_search=100, training_sample_size=min(start+count, 250000))
+        sb.tree(num_leaves=self.num_leaves, num_leaves_to_search=100, training_sample_size=min(start+count-self.expired, 250000))
         sb.score_ah(dimensions_per_block=2, anisotropic_quantization_threshold=0)
 
         # Re-compute based on the actual vectors
         if self.reorder:
             sb.reorder(self.reorder)
 
-        self.index = sb.build()
+        self.index = sb.build() # Replaces the old searcher once built, so concurrent queries need no lock
 
     def do_update(self, vecs, start, count):
         self.do_add(vecs, 0, vecs.shape[0])
@@ -39,5 +41,14 @@ class ScannANN(BaseANN):
     def query(self, vecs, topk, cfg):
         ids, _ = self.index.search_batched(vecs, leaves_to_search=cfg.algo.query.nprobe, final_num_neighbors=topk)
         # Note: There exists a function .search_batched_parallel() as well.
-        return ids
-
+        return self.expired + ids
+
+    def index_size(self):
+        # Size of each serialized asset, eg. the partitioner, codebook and hashed dataset
+        index, sizes = self.index, {}
+        with tempfile.TemporaryDirectory() as path:
+            index.serialize(path)
+            for name in os.listdir(path):
+                sizes[os.path.splitext(name)[0]] = os.path.getsize(os.path.join(path, name))
+        sizes["serialized"] = sum(sizes.values())
+        return sizes
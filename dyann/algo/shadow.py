@@ -0,0 +1,148 @@
+from .wrapper import WrapperANN
+import numpy as np
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import weakref
+from statistics import NormalDist
+
+log = logging.getLogger(__name__)
+
+# A sample of the queries is replayed by a worker process against an exact search over the visible samples,
+# so recall can be estimated while the benchmark runs, without pregenerated groundtruth.
+# Samples become visible when they arrive, before any delayed add events are applied to the wrapped index.
+# Copying the rows and queries sent to the worker runs inside the timed events, so its cost is reported separately
+# as shadow_overhead_add and shadow_overhead_query seconds, to be subtracted from the update and query timings.
+
+class ShadowANN(WrapperANN):
+    params = ["sample", "confidence"]
+
+    def __init__(self):
+        super().__init__()
+        self.sample, self.z, self.rng = None, None, None
+        self.worker, self.inbox, self.outbox, self.finalizer = None, None, None, None
+        self.visible, self.pending, self.mutex = None, None, threading.Lock()
+        self.count, self.mean, self.m2 = None, None, None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.sample = cfg.algo.build.sample
+        self.z = NormalDist().inv_cdf((1 + cfg.algo.build.get("confidence", 0.95)) / 2)
+        self.rng = np.random.default_rng(0)
+        if self.worker is None:
+            context = multiprocessing.get_context("spawn")
+            self.inbox, self.outbox = context.Queue(), context.Queue()
+            self.worker = context.Process(target=_serve, args=(self.inbox, self.outbox), daemon=True)
+            self.worker.start()
+            self.finalizer = weakref.finalize(self, _shutdown, self.worker, self.inbox)
+        self.inbox.put(("reset", D, maxN))
+        self.visible, self.pending = 0, 0
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0 # Running moments of the sampled recall
+        self.stats.update({"shadow_samples": 0, "shadow_recall": 0.0, "shadow_recall_ci": 0.0, "shadow_recall_running": [],
+                           "shadow_overhead_build": 0.0, "shadow_overhead_add": 0.0, "shadow_overhead_query": 0.0})
+
+    def forward(self, vecs, start, count, stat="shadow_overhead_add"):
+        # Rows are sent in chunks to bound the size of each message, copied as the queue pickles them later on its
+        # feeder thread, after the driver may have overwritten them
+        t0 = time.perf_counter()
+        for chunk in range(start, start + count, 65536):
+            self.inbox.put(("rows", chunk, np.array(vecs[chunk:min(chunk+65536, start+count)], dtype='float32')))
+        with self.mutex:
+            self.visible = max(self.visible, start + count)
+            self.stats[stat] = self.stats[stat] + time.perf_counter() - t0
+
+    def add(self, vecs, start, count):
+        self.forward(vecs, start, count)
+        super().add(vecs, start, count)
+
+    def update(self, vecs, start, count):
+        self.forward(vecs, start, count)
+        super().update(vecs, start, count)
+
+    def remove(self, vecs, start, count):
+        self.inbox.put(("expire", start + count))
+        super().remove(vecs, start, count)
+
+    def do_add(self, vecs, start, count):
+        if start + count > self.visible:
+            # Added directly, eg. the base set
+            self.forward(vecs, max(start, self.visible), start + count - max(start, self.visible), "shadow_overhead_build")
+        super().do_add(vecs, start, count)
+
+    def query(self, vecs, topk, cfg):
+        ids = super().query(vecs, topk, cfg)
+        t0 = time.perf_counter()
+        with self.mutex: # Queries run concurrently to each other and the writer in the concurrent mode
+            if self.rng.random() < self.sample:
+                self.inbox.put(("query", np.array(vecs, dtype='float32'), np.array(ids).astype('int64').reshape(len(vecs), -1)))
+                self.pending = self.pending + 1
+            self.collect(block=False)
+            self.stats["shadow_overhead_query"] = self.stats["shadow_overhead_query"] + time.perf_counter() - t0
+        return ids
+
+    def collect(self, block):
+        """Accumulate the recall measured by the worker, waiting for all pending queries if blocking, called with the mutex held"""
+        while self.pending > 0:
+            try:
+                recalls = self.outbox.get(block=block)
+            except queue.Empty:
+                break
+            self.pending = self.pending - 1
+            if isinstance(recalls, str):
+                raise RuntimeError(f"Shadow search failed\n{recalls}")
+            for recall in recalls:
+                # Welford update of the mean and variance
+                self.count = self.count + 1
+                delta = recall - self.mean
+                self.mean = self.mean + delta / self.count
+                self.m2 = self.m2 + delta * (recall - self.mean)
+            ci = self.z * np.sqrt(self.m2 / (self.count - 1) / self.count) if self.count > 1 else 1.0
+            self.stats["shadow_samples"] = self.count
+            self.stats["shadow_recall"] = float(self.mean)
+            self.stats["shadow_recall_ci"] = float(ci)
+            self.stats["shadow_recall_running"].append(float(self.mean))
+            if self.count % 100 < len(recalls):
+                log.info(f"Estimated recall {self.mean:.4f} +/- {ci:.4f} over {self.count} sampled queries")
+
+    def finish(self):
+        super().finish()
+        with self.mutex:
+            self.collect(block=True)
+
+def _shutdown(worker, inbox):
+    inbox.put(("close",))
+    worker.join(timeout=5)
+    if worker.is_alive():
+        worker.terminate()
+
+def _serve(inbox, outbox):
+    """Worker process loop keeping a copy of the visible samples and searching them exactly"""
+    import faiss
+    import traceback
+    faiss.omp_set_num_threads(1)
+    vecs, n, expired = None, 0, 0
+    while True:
+        message = inbox.get()
+        if message[0] == "close":
+            break
+        if message[0] == "reset":
+            _, D, maxN = message
+            vecs, n, expired = np.zeros([maxN, D]).astype('float32'), 0, 0
+        elif message[0] == "rows":
+            _, start, rows = message
+            if start + len(rows) > vecs.shape[0]:
+                vecs = np.concatenate([vecs, np.zeros([max(start + len(rows), 2 * vecs.shape[0]) - vecs.shape[0], vecs.shape[1]]).astype('float32')])
+            vecs[start:start+len(rows)] = rows
+            n = max(n, start + len(rows))
+        elif message[0] == "expire":
+            expired = max(expired, message[1])
+        elif message[0] == "query":
+            _, queries, ids = message
+            try:
+                topk = min(ids.shape[1], n - expired)
+                _, gt = faiss.knn(queries, vecs[expired:n], topk)
+                outbox.put([len(set(ids[q]) & set(gt[q] + expired)) / topk if topk > 0 else 1.0 for q in range(len(queries))])
+            except Exception:
+                outbox.put(traceback.format_exc())
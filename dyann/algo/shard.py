@@ -0,0 +1,246 @@
+from .base import BaseANN
+import numpy as np
+import multiprocessing
+import traceback
+import weakref
+from multiprocessing import shared_memory
+from omegaconf import OmegaConf
+
+# Samples are partitioned round-robin, global id g lives on shard g % N under the local id g // N.
+# Each shard is a worker process hosting any other adapter on a contiguous local id range, so positional
+# adapters and the expiry watermark keep working unchanged inside the shard.
+
+class ShardANN(BaseANN):
+    def __init__(self):
+        super().__init__()
+        self.algo, self.shards, self.workers, self.pipes = None, None, [], []
+        self.inputs, self.shared, self.ids, self.dists = [], None, [], []
+        self.finalizer = None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.close()
+        self.algo = cfg.algo.build.algo
+        self.shards = cfg.algo.build.shards
+        # Configuration of the hosted adapter, the shards apply batches as soon as they are routed
+        shard_cfg = OmegaConf.to_container(cfg, resolve=True)
+        shard_cfg["algo"]["name"] = self.algo
+        shard_cfg["algo"]["build"] = {key: value for key, value in shard_cfg["algo"]["build"].items() if key not in ["algo", "shards"]}
+        shard_cfg["algo"]["build"]["skips"] = 0
+        # Start the worker processes
+        context = multiprocessing.get_context("spawn")
+        for s in range(self.shards):
+            parent, child = context.Pipe()
+            worker = context.Process(target=_serve, args=(child, shard_cfg), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+            self.pipes.append(parent)
+        self.inputs = [SharedBuffer("float32") for s in range(self.shards)]
+        self.ids = [SharedBuffer("int64") for s in range(self.shards)]
+        self.dists = [SharedBuffer("float32") for s in range(self.shards)]
+        self.shared = SharedBuffer("float32")
+        self.finalizer = weakref.finalize(self, _shutdown, self.workers, self.pipes, [self.shared, *self.inputs, *self.ids, *self.dists])
+        self.broadcast(["init"] * self.shards, [(D, maxN // self.shards + 1)] * self.shards)
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+        self.workers, self.pipes, self.finalizer = [], [], None
+
+    def has_train(self):
+        from .proxy import instantiate_algorithm
+        return instantiate_algorithm(cfg=OmegaConf.create({"algo": {"name": self.algo}})).has_train()
+
+    def train(self, vecs):
+        self.shared.reserve(vecs.shape)[:] = vecs
+        self.broadcast(["train"] * self.shards, [(vecs.shape[0],)] * self.shards)
+
+    def do_add(self, vecs, start, count):
+        self.route("add", vecs, start, count)
+
+    def do_update(self, vecs, start, count):
+        self.route("update", vecs, start, count)
+
+    def do_remove(self, vecs, start, count):
+        self.expired = start + count
+        args = [(local(start, s, self.shards), local(start + count, s, self.shards)) for s in range(self.shards)]
+        self.broadcast(["remove" if hi > lo else None for lo, hi in args], args)
+
+    def route(self, cmd, vecs, start, count):
+        # Copy the rows owned by each shard into its input buffer
+        args = []
+        for s in range(self.shards):
+            first = start + (s - start) % self.shards
+            rows = np.asarray(vecs[first:start+count:self.shards])
+            self.inputs[s].reserve(rows.shape)[:] = rows
+            args.append((local(start, s, self.shards), local(start + count, s, self.shards)))
+        self.broadcast([cmd if hi > lo else None for lo, hi in args], args)
+
+    def query(self, vecs, topk, cfg):
+        vecs = np.asarray(vecs)
+        self.shared.reserve(vecs.shape)[:] = vecs
+        for s in range(self.shards):
+            self.ids[s].reserve((vecs.shape[0], topk))
+            self.dists[s].reserve((vecs.shape[0], topk))
+        self.broadcast(["query"] * self.shards, [(vecs.shape[0], topk, OmegaConf.to_container(cfg.algo.query))] * self.shards)
+        # Merge the per-shard top-k by distance
+        ids = [self.ids[s].array[:vecs.shape[0],:topk] for s in range(self.shards)]
+        ids = np.concatenate([np.where(ids[s] < 0, -1, ids[s] * self.shards + s) for s in range(self.shards)], axis=1)
+        dists = np.concatenate([self.dists[s].array[:vecs.shape[0],:topk] for s in range(self.shards)], axis=1)
+        order = np.argsort(dists, axis=1, kind="stable")[:,:topk]
+        return np.take_along_axis(ids, order, axis=1)
+
+    def get_memory_usage(self, type):
+        """Return the current memory usage of this process and its shards"""
+        usage = super().get_memory_usage(type)
+        if len(self.pipes) == 0:
+            return usage
+        for memory in self.broadcast(["memory"] * self.shards, [(type,)] * self.shards):
+            usage = usage + memory
+        return usage
+
+    def index_size(self):
+        sizes = {}
+        for shard in self.broadcast(["size"] * self.shards, [()] * self.shards):
+            for key, value in shard.items():
+                sizes[key] = sizes.get(key, 0) + value
+        return sizes
+
+    def broadcast(self, cmds, args):
+        """Send a command to each shard, skipping None, and wait for all of them to reply"""
+        with self.lock.write: # Pipes carry one conversation at a time
+            for s, (cmd, arg) in enumerate(zip(cmds, args)):
+                if cmd is not None:
+                    specs = {"input": self.inputs[s].spec(), "shared": self.shared.spec(), "ids": self.ids[s].spec(), "dists": self.dists[s].spec()}
+                    self.pipes[s].send((cmd, arg, specs))
+            replies = []
+            for s, cmd in enumerate(cmds):
+                if cmd is not None:
+                    status, reply = self.pipes[s].recv()
+                    if status == "error":
+                        raise RuntimeError(f"Shard {s} failed on {cmd}\n{reply}")
+                    replies.append(reply)
+        return replies
+
+def local(g, s, N):
+    """Number of global ids below g owned by shard s, ie. the local id of the next sample on that shard"""
+    return max((g - s + N - 1) // N, 0)
+
+class SharedBuffer(object):
+    """ Array in a named shared memory block, reallocated when a larger shape is reserved
+
+    Methods:
+        reserve: Return a view of the requested shape, growing the block if needed
+        spec: Name, shape and dtype used by a worker process to attach the block
+        close: Release and unlink the block
+    """
+
+    def __init__(self, dtype):
+        self.dtype = np.dtype(dtype)
+        self.shm, self.array = None, None
+
+    def reserve(self, shape):
+        shape = tuple(int(x) for x in shape)
+        if self.array is None or shape[0] > self.array.shape[0] or shape[1:] != self.array.shape[1:]:
+            rows = shape[0] if self.array is None or shape[1:] != self.array.shape[1:] else max(shape[0], 2 * self.array.shape[0])
+            self.close()
+            size = max(int(np.prod((rows,) + shape[1:])) * self.dtype.itemsize, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.array = np.ndarray((rows,) + shape[1:], dtype=self.dtype, buffer=self.shm.buf)
+        return self.array[:shape[0]]
+
+    def spec(self):
+        if self.shm is None:
+            return None
+        return (self.shm.name, self.array.shape, self.dtype.str)
+
+    def close(self):
+        if self.shm is not None:
+            self.array = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+def _shutdown(workers, pipes, buffers):
+    for pipe in pipes:
+        try:
+            pipe.send(("close", None, {}))
+        except (BrokenPipeError, OSError):
+            pass
+    for worker in workers:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
+    for buffer in buffers:
+        buffer.close()
+
+def _attach(blocks, role, spec):
+    """Attach a shared memory block in a worker process, reusing the last block attached for a role"""
+    if spec is None:
+        return None
+    name, shape, dtype = spec
+    if role not in blocks or blocks[role][0].name != name or blocks[role][1].shape != tuple(shape):
+        if role in blocks:
+            shm, array = blocks.pop(role)
+            del array
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        blocks[role] = (shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+    return blocks[role][1]
+
+def _serve(pipe, cfg):
+    """Worker process loop hosting one shard"""
+    from .proxy import instantiate_algorithm
+    cfg = OmegaConf.create(cfg)
+    algo = instantiate_algorithm(cfg=cfg)
+    blocks, vecs, n = {}, None, 0
+    while True:
+        cmd, arg, specs = pipe.recv()
+        if cmd == "close":
+            break
+        try:
+            arrays = {role: _attach(blocks, role, spec) for role, spec in specs.items()}
+            reply = None
+            if cmd == "init":
+                D, maxN = arg
+                algo.init(D=D, maxN=maxN, cfg=cfg)
+                vecs, n = np.zeros([maxN, D]).astype('float32'), 0
+            elif cmd == "train":
+                algo.train(vecs=np.array(arrays["shared"][:arg[0]]))
+            elif cmd == "add" or cmd == "update":
+                lo, hi = arg
+                vecs[lo:hi] = arrays["input"][:hi-lo]
+                n = max(n, hi)
+                if cmd == "add":
+                    algo.do_add(vecs[:n], lo, hi - lo)
+                else:
+                    algo.do_update(vecs[:n], lo, hi - lo)
+            elif cmd == "remove":
+                lo, hi = arg
+                if hi > lo:
+                    algo.do_remove(vecs[:n], lo, hi - lo)
+            elif cmd == "query":
+                nq, topk, query = arg
+                if cfg.algo.get("query") is None or OmegaConf.to_container(cfg.algo.query) != query:
+                    cfg.algo.query = query
+                queries = np.array(arrays["shared"][:nq])
+                ids = -1 * np.ones([nq, topk]).astype('int64')
+                if n > 0:
+                    found = np.array(algo.query(vecs=queries, topk=topk, cfg=cfg)).astype('int64').reshape(nq, -1)[:,:topk]
+                    ids[:,:found.shape[1]] = found
+                valid = (ids >= 0) & (ids < n)
+                dists = np.sum((vecs[np.where(valid, ids, 0)] - queries[:,None,:]) ** 2, axis=2)
+                arrays["dists"][:nq,:topk] = np.where(valid, dists, np.inf)
+                arrays["ids"][:nq,:topk] = np.where(valid, ids, -1)
+            elif cmd == "memory":
+                reply = algo.get_memory_usage(arg[0])
+            elif cmd == "size":
+                reply = algo.index_size()
+            arrays = None # Release the views so that replaced blocks can be closed
+            pipe.send(("ok", reply))
+        except Exception:
+            arrays = None
+            pipe.send(("error", traceback.format_exc()))
+    for shm, array in blocks.values():
+        del array
+        shm.close()
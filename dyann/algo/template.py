@@ -54,6 +54,8 @@ class TemplateANN(BaseANN):
         """
         # TODO Add each sample vector to the ANN
         #   if updating sample is possible, include an implementation of the do_update method inherited from BaseANN
+        #   if removing samples is possible, include an implementation of the do_remove method inherited from BaseANN
+        #   otherwise removed samples are handled by rebuilding from the samples above self.expired
 
     def query(self, vecs, topk, cfg):
         """
@@ -70,3 +72,13 @@ class TemplateANN(BaseANN):
         # TODO Generate ANN results for each query vector 
         return []
 
+    def index_size(self):
+        """
+        A method for measuring the memory used by the ANN algorithm index
+
+        Returns:
+            A dictionary of the bytes used by each part of the index, eg. codes, links or serialized size
+        """
+        # TODO (optional) Measure each part of the index, otherwise only process memory usage is reported
+        return {}
+
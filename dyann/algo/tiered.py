@@ -0,0 +1,116 @@
+from .base import BaseANN
+from .ivfpq import IvfpqANN
+from ..util import rerank
+from omegaconf import OmegaConf
+import numpy as np
+
+# Samples arrive in time order and the oldest are rarely modified, so the newest are kept in a fast hot tier, eg. hnsw,
+# and aged into a compressed cold tier, eg. ivfpq, once the hot tier exceeds its share of the samples. Both tiers are
+# searched and their results merged by exact distance. Migrations run inside the add events, so their cost is
+# measured as update time.
+
+class TieredANN(BaseANN):
+    def __init__(self):
+        super().__init__()
+        self.hot, self.cold, self.limit = None, None, None
+        self.boundary, self.end, self.vecs = None, None, None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        self.limit = max(int(maxN * cfg.algo.build.hot), 2)
+        # Deleted hot slots are reused, so the hot tier never holds more than the limit
+        self.hot = self.tier(D=D, maxN=2 * self.limit, cfg=cfg, build=cfg.algo.build.hot_tier)
+        self.cold = self.tier(D=D, maxN=maxN, cfg=cfg, build=cfg.algo.build.cold_tier)
+        self.boundary = 0 # Samples below this index are in the cold tier
+        self.end = 0 # Samples from the boundary up to this index are live in the hot tier
+        self.vecs = None
+        self.stats.update({"tier_migrations": 0, "tier_migrated": 0, "tier_hot": 0})
+
+    def tier(self, D, maxN, cfg, build):
+        """Instantiate the algorithm named by algo in the build properties of a tier"""
+        from .proxy import instantiate_algorithm
+        tier_cfg = OmegaConf.create(cfg)
+        tier_cfg.algo.name = build.algo
+        tier_cfg.algo.build = {key: value for key, value in build.items() if key != "algo"}
+        tier_cfg.algo.build.skips = 0 # Events are delayed by the tiered index
+        algo = instantiate_algorithm(cfg=tier_cfg)
+        algo.init(D=D, maxN=maxN, cfg=tier_cfg)
+        algo.lock = self.lock
+        return algo
+
+    def has_train(self):
+        return bool(self.hot.has_train()) or bool(self.cold.has_train())
+
+    def train(self, vecs):
+        for algo in [self.hot, self.cold]:
+            if algo.has_train():
+                algo.train(vecs)
+
+    def do_add(self, vecs, start, count):
+        self.vecs = vecs
+        end = start + count
+        target = self.boundary
+        if end - self.boundary > self.limit:
+            target = end - self.limit // 2 # Age down to half the limit, so migrations are batched
+        # Migrate the aged hot samples, copying before removing so queries always find them in a tier
+        aged = min(target, start) - self.boundary
+        if aged > 0:
+            self.cold.do_add(vecs, self.boundary, aged)
+            self.hot.do_remove(vecs, self.boundary, aged)
+            self.stats["tier_migrations"] = self.stats["tier_migrations"] + 1
+            self.stats["tier_migrated"] = self.stats["tier_migrated"] + aged
+        # New samples older than the target, eg. most of the base set, go straight to the cold tier
+        split = min(max(target, start), end)
+        if split > start:
+            self.cold.do_add(vecs, start, split - start)
+        if end > split:
+            self.hot.do_add(vecs, split, end - split)
+        self.boundary = max(self.boundary, target)
+        self.end = max(self.end, end)
+        self.stats["tier_hot"] = self.end - self.boundary
+
+    def do_update(self, vecs, start, count):
+        self.vecs = vecs
+        split = min(max(self.boundary, start), start + count)
+        if split > start:
+            if isinstance(self.cold, IvfpqANN):
+                self.replace(self.cold, vecs, start, split - start)
+            else:
+                self.cold.do_update(vecs, start, split - start)
+        if start + count > split:
+            self.hot.do_update(vecs, split, start + count - split)
+
+    def replace(self, algo, vecs, start, count):
+        """Remove the previous codes of updated samples before adding them again, as ivfpq updates only add codes"""
+        expired = algo.expired
+        algo.do_remove(vecs, start, count)
+        algo.expired = expired # Not an expiry
+        algo.do_add(vecs, start, count)
+
+    def do_remove(self, vecs, start, count):
+        split = min(max(self.boundary, start), start + count)
+        if split > start:
+            self.cold.do_remove(vecs, start, split - start)
+        if start + count > split:
+            self.hot.do_remove(vecs, split, start + count - split)
+        self.boundary = max(self.boundary, start + count)
+        self.end = max(self.end, self.boundary)
+        self.stats["tier_hot"] = self.end - self.boundary
+        self.expired = start + count
+
+    def query(self, vecs, topk, cfg):
+        # Each tier reads its own search properties, eg. ef for hnsw and nprobe for ivfpq. The hot tier can hold fewer
+        # than topk live samples, eg. after a migration or removal, which hnswlib cannot return
+        tiers = [(self.hot, min(topk, self.end - self.boundary)), (self.cold, topk)]
+        candidates = [np.array(algo.query(vecs, k, cfg)).astype('int64').reshape(len(vecs), -1) for algo, k in tiers if k > 0]
+        with self.lock.read:
+            return rerank(np.asarray(vecs, dtype='float32'), np.concatenate(candidates, axis=1), lambda ids: self.vecs[ids], topk)
+
+    def index_size(self):
+        sizes = {f"hot_{key}": value for key, value in self.hot.index_size().items()}
+        sizes.update({f"cold_{key}": value for key, value in self.cold.index_size().items()})
+        return sizes
+
+    def finish(self):
+        self.hot.finish()
+        self.cold.finish()
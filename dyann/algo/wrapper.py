@@ -0,0 +1,60 @@
+from .base import BaseANN
+from omegaconf import OmegaConf
+
+class WrapperANN(BaseANN):
+    """ Base class for algorithms layered over another ANN algorithm
+
+    The wrapped algorithm is named by algo in the build properties and built with the remaining properties,
+    except those listed in params which belong to the wrapper. Events are delayed by the wrapper, so the wrapped
+    algorithm applies each batch as soon as it is forwarded. Every method forwards to the wrapped algorithm
+    unless overridden.
+
+    Attributes:
+        params: Build properties consumed by the wrapper
+        algo: Name of the wrapped algorithm
+        inner: Instance of the wrapped algorithm
+        inner_cfg: OmegaConf object with the build properties of the wrapped algorithm
+    """
+
+    params = []
+
+    def __init__(self):
+        super().__init__()
+        self.algo, self.inner, self.inner_cfg = None, None, None
+
+    def init(self, D, maxN, cfg):
+        super().init(D=D, maxN=maxN, cfg=cfg)
+        from .proxy import instantiate_algorithm
+        self.algo = cfg.algo.build.algo
+        self.inner_cfg = OmegaConf.create(cfg)
+        self.inner_cfg.algo.name = self.algo
+        self.inner_cfg.algo.build = {key: value for key, value in cfg.algo.build.items() if key not in ["algo", *self.params]}
+        self.inner_cfg.algo.build.skips = 0
+        self.inner = instantiate_algorithm(cfg=self.inner_cfg)
+        self.inner.init(D=D, maxN=maxN, cfg=self.inner_cfg)
+        self.inner.lock = self.lock # Enabled together with the wrapper for concurrent workloads
+
+    def has_train(self):
+        return self.inner.has_train()
+
+    def train(self, vecs):
+        self.inner.train(vecs)
+
+    def do_add(self, vecs, start, count):
+        self.inner.do_add(vecs, start, count)
+
+    def do_update(self, vecs, start, count):
+        self.inner.do_update(vecs, start, count)
+
+    def do_remove(self, vecs, start, count):
+        self.inner.do_remove(vecs, start, count)
+        self.expired = self.inner.expired
+
+    def query(self, vecs, topk, cfg):
+        return self.inner.query(vecs, topk, cfg)
+
+    def finish(self):
+        self.inner.finish()
+
+    def index_size(self):
+        return self.inner.index_size()
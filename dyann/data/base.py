@@ -10,6 +10,11 @@ class BaseDataset(object):
         vecs_query: load or generate a vector of query samples
         groundtruth: load groundtruth data
         D: Length of each sample vector
+        files: (optional) sample vector files that can be served from shared memory by serve-data.py
+    Attributes:
+        series: (optional) additional named timings collected by the last call to evaluate
+        usage: (optional) dyann.util.Usage accumulating the cost of the query, update and remove events in evaluate
+        prefix: (optional) fraction of the workload run by evaluate, shorter runs return fewer timings and indices
     """
     
     def __init__(self, cfg):
@@ -33,6 +38,9 @@ class BaseDataset(object):
     def groundtruth(self):
         pass
 
+    def files(self):
+        return []
+
     def D(self):
         """Length of each sample vector"""
         vecs = self.vecs_train()
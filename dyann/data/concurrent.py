@@ -0,0 +1,119 @@
+import threading
+import time
+import numpy as np
+
+class ConcurrentDriver(object):
+    """
+    A class for running a workload with query workers concurrent to a single update writer
+
+    The writer steps through the workload publishing the queries of each step before applying its update event,
+    while the query workers claim published steps in order and run them as soon as they become available.
+    The native libraries release the GIL while searching and inserting, so the threads overlap in practice.
+
+    Attributes:
+        steps: Number of steps in the workload, each with a batch of queries and an update event
+        workers: Number of query worker threads
+        latency: Time taken to run the queries of each step
+        finish: Time at which the queries of each step completed, relative to the start of the run
+        writetime: Time taken to apply the update event of each step
+
+    Methods:
+        __init__: Initialising internal parameters
+        run: Execute the workload on the writer and query worker threads
+    """
+
+    def __init__(self, steps, workers):
+        self.steps = steps
+        self.workers = workers
+        self.latency = np.zeros([steps])
+        self.finish = np.zeros([steps])
+        self.writetime = np.zeros([steps])
+        self.queries = [None] * steps
+        self.published, self.claimed = 0, 0
+        self.cond = threading.Condition()
+        self.errors = []
+
+    def run(self, algo, prepare, query, write):
+        """
+        A method for running the workload, raising the first error encountered on any thread
+
+        Parameters:
+            algo: An ANN algorithm inheriting from BaseANN, locked for concurrent access during the run
+            prepare: Function returning the query vectors of a step, called by the writer before its update
+            query: Function running the query vectors of a step, called by a query worker
+            write: Function applying the update event of a step, called by the writer
+        """
+        self.t0 = time.perf_counter()
+        algo.lock.enabled = True
+        threads = [threading.Thread(target=self.reader, args=(query,)) for _ in range(self.workers)]
+        threads.append(threading.Thread(target=self.writer, args=(prepare, write)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        algo.lock.enabled = False
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def writer(self, prepare, write):
+        try:
+            for step in range(self.steps):
+                vecs = prepare(step)
+                with self.cond:
+                    self.queries[step] = vecs
+                    self.published = step + 1
+                    self.cond.notify_all()
+                t0 = time.perf_counter()
+                write(step)
+                self.writetime[step] = time.perf_counter() - t0
+        except Exception as e:
+            self.abort(e)
+
+    def reader(self, query):
+        try:
+            while True:
+                with self.cond:
+                    while self.claimed >= self.published and self.claimed < self.steps:
+                        self.cond.wait()
+                    if self.claimed >= self.steps:
+                        return
+                    step = self.claimed
+                    self.claimed = step + 1
+                    vecs, self.queries[step] = self.queries[step], None
+                t0 = time.perf_counter()
+                query(step, vecs)
+                t1 = time.perf_counter()
+                self.latency[step] = t1 - t0
+                self.finish[step] = t1 - self.t0
+        except Exception as e:
+            self.abort(e)
+
+    def abort(self, e):
+        with self.cond:
+            self.errors.append(e)
+            self.published, self.claimed = self.steps, self.steps
+            self.cond.notify_all()
+
+    def buckets(self, timings, queries):
+        """
+        A method for summarising the run over equally sized buckets of steps
+
+        Parameters:
+            timings: Number of buckets
+            queries: Number of query vectors in each step
+        Returns:
+            A dictionary of timings per bucket: query throughput and median and tail step latency
+        """
+        series = {"throughput": np.zeros([timings]), "searchtime_p50": np.zeros([timings]), "searchtime_p99": np.zeros([timings])}
+        bounds = np.linspace(0, self.steps, timings + 1).astype('int')
+        end = 0.0
+        for b in range(timings):
+            latency = self.latency[bounds[b]:bounds[b+1]]
+            finish = self.finish[bounds[b]:bounds[b+1]]
+            if len(latency) == 0:
+                continue
+            series["throughput"][b] = queries * len(latency) / max(np.max(finish) - end, 1e-9)
+            series["searchtime_p50"][b] = np.percentile(latency, 50)
+            series["searchtime_p99"][b] = np.percentile(latency, 99)
+            end = max(end, np.max(finish))
+        return series
@@ -1,10 +1,11 @@
 from .base import BaseDataset
 from pathlib import Path
-from urllib.request import urlretrieve
-import tarfile
 import numpy as np
 import time
-from ..util import ivecs_read, fvecs_read, ivecs_write, lerp
+from ..util import ivecs_read, ivecs_write, vecs_shape, lerp, Usage
+from .store import vecs_store
+from .shared import fvecs_load, writable
+from .fetch import fetch, extract_members
 
 class OnlineDataCollection(BaseDataset):
     """
@@ -23,15 +24,35 @@ class OnlineDataCollection(BaseDataset):
         mode: Dataset mode specified by configuration files to enable/disable following attributes
         freq: Relative frequency of index queries and index updates
         lerp: Degree of interpolation between consecutive datapoints [0.0,1.0]
+        window: Number of visible samples relative to the base set before the oldest expire
+        workers: Number of query threads run concurrently to the add events, or 0 to alternate on one thread
+        dtype: Precision at which base and query vectors are stored {float32, float16, int8}
+        source: Location of the dataset tarball
+        mirror: Local directory or url prefix searched first for the dataset tarball
+        checksum: Expected checksum of the dataset tarball as "<algorithm>:<hex digest>"
+        prefix: Fraction of the workload evaluated when alternating on one thread, used to shortlist configurations
+        shared: Map the sample vectors served by serve-data.py instead of loading a private copy
+        mmap: Map the sample vector files and convert rows as they are accessed, for collections larger than memory
+        base: Sample vector file relative to path, an fvecs, bvecs or HDF5 file such as the SIFT1B bigann_base.bvecs
+        learn: Training vector file relative to path
+        keys: Names of the HDF5 datasets holding the base and learn vectors, eg. train for ann-benchmarks files
+        train_size: Number of leading training vectors loaded, or None for the whole file
+        series: Additional timings collected by evaluate, the time to remove expired samples
+        usage: CPU time, context switches and page faults of the query, update and remove events, when enabled
 
     Methods:
         __init__: Initialising internal parameters
         evaluate: Performance on a simulated dataset of that is continuously growing over time
+        evaluate_concurrent: Performance with queries run concurrently to the add events
         pregen: Download dataset files and computing groundtruth data using exhaustive searches
         vecs_train: Load training set of vectors used to tune ANN algorithms that require it
         vecs_base: Load base set of vectors used to initialise each ANN algorithm
         vecs_query: Load query set of vectors used to evaluate each ANN algorithm
         groundtruth: Load groundtruth indices used to evaluate each ANN algorithm
+        files: Sample vector files that can be served from shared memory
+        sample_size: Number of queries stored for comparison with the groundtruth
+        gt_keys: Query index and visible sample range of each groundtruth row
+        gt_path: Location of the groundtruth file of the mode, scale, window and frequency
     """
     
     # Adapted from annbench https://github.com/matsui528/annbench/blob/main/annbench/dataset/sift1m.py
@@ -49,92 +70,227 @@ class OnlineDataCollection(BaseDataset):
         self.lerp = 0.0
         if self.mode == 'lerp':
             self.lerp = cfg.data.lerp
-        
+        self.window = 0.0
+        if self.mode == 'window':
+            self.window = cfg.data.window
+        self.workers = 0
+        if self.mode == 'concurrent':
+            self.workers = cfg.data.workers
+            self.mode = 'default' # Shares the groundtruth of the default mode
+        self.prefix = 1.0
+        self.dtype = cfg.data.get("dtype", "float32")
+        self.source = cfg.data.get("source", "ftp://ftp.irisa.fr/local/texmex/corpus/sift.tar.gz")
+        self.mirror = cfg.data.get("mirror", cfg.get("mirror"))
+        self.checksum = cfg.data.get("checksum")
+        self.shared = cfg.data.get("shared", cfg.get("shared", False))
+        self.base = cfg.data.get("base", "sift/sift_base.fvecs")
+        # Collections larger than memory, eg. bvecs or streamed in chunks, are mapped, others are loaded before the build
+        self.mmap = cfg.data.get("mmap", cfg.get("chunk") is not None or Path(self.base).suffix == ".bvecs")
+        self.learn = cfg.data.get("learn", "sift/sift_learn.fvecs")
+        self.keys = cfg.data.get("keys", {"base": None, "learn": None})
+        self.train_size = cfg.data.get("train_size")
+        self.series = {}
+        self.usage = Usage()
+
     def evaluate(self, algo, cfg):
+        if self.workers > 0:
+            return self.evaluate_concurrent(algo, cfg)
         # Load queries
         vecs = self.vecs_query()
+        if self.lerp > 0:
+            vecs = writable(vecs) # Queries are modified as the benchmark runs
         # Initialise parameters
         nq = int(vecs.shape[0] / 2)
-        ngt = 10000
-        if self.trunc < 10:
-            ngt = 100
-        elif self.trunc < 100:
-            ngt = 1000
+        ngt = self.sample_size()
+        steps = range(nq, nq + int(nq * self.prefix), self.freq)
+        # Interpolate each query towards the previous sample before timing, the values only depend on earlier samples
+        if self.lerp > 0:
+            for query in steps:
+                vecs[query] = lerp(vecs[query], vecs[query-1], self.lerp)
+        # Contiguous float32 queries are viewed in place, others, eg. quantized stores, are decoded one timing bucket at a
+        # time before timing, so the memory sampled is not inflated by a decoded copy of every query
+        inplace = isinstance(vecs, np.ndarray) and vecs.dtype == np.float32 and vecs.flags.c_contiguous
+        bucket = int(np.ceil(nq / self.timings)) + self.freq
+        queries, first = (vecs, 0) if inplace else (None, nq - bucket)
         # Initialise results
         ids = -1 * np.ones([ngt, cfg.topk]).astype('int') # Run all queries, store gt indices only
         ts = np.zeros([self.timings, 3])
+        self.series = {}
+        if self.window > 0:
+            self.series["removetime_per_query"] = np.zeros([self.timings])
         idi, ti = 0, 0
         id = -1 * np.ones([cfg.topk])
+        size, expired = int(nq * self.window), 0
         # Run benchmark
-        for query in range(nq, nq*2, self.freq):
-            # Get sample
-            if self.lerp > 0:
-                vecs[query] = lerp(vecs[query], vecs[query-1], self.lerp)
+        for query in steps:
+            if not inplace and query + self.freq > first + bucket:
+                queries, first = np.ascontiguousarray(np.asarray(vecs[query:query+bucket], dtype='float32')), query
             # Process queries
-            t0 = time.time()
-            if self.mode == "es_freq":
-                id = algo.query(vecs=np.array(vecs[query:query+self.freq,:]), topk=cfg.topk, cfg=cfg)
-                ts[ti,0] = ts[ti,0] + time.time() - t0
-                id = np.array(id[0])
-            else:
-                id = algo.query(vecs=np.array([vecs[query]]), topk=cfg.topk, cfg=cfg)
-                ts[ti,0] = ts[ti,0] + time.time() - t0
+            with self.usage.phase("query", items=self.freq if self.mode == "es_freq" else 1): # es_freq searches freq queries at a time
+                if self.mode == "es_freq":
+                    t0 = time.perf_counter()
+                    id = algo.query(vecs=queries[query-first:query-first+self.freq], topk=cfg.topk, cfg=cfg)
+                    elapsed = time.perf_counter() - t0
+                    id = np.array(id[0])
+                else:
+                    t0 = time.perf_counter()
+                    id = algo.query(vecs=queries[query-first:query-first+1], topk=cfg.topk, cfg=cfg)
+                    elapsed = time.perf_counter() - t0
+                ts[ti,0] = ts[ti,0] + elapsed
+            algo.queried(elapsed)
             if (query) % (nq / ngt) <= (query - self.freq) % (nq / ngt):
                 id = np.array(id)
                 ids[idi,:len(id.squeeze())] = id
                 idi = idi + 1
             # Process add events
-            t0 = time.time()
-            algo.add(vecs=vecs[:query+self.freq], start=query, count=self.freq)
-            ts[ti,1] = ts[ti,1] + time.time() - t0
+            with self.usage.phase("update", items=self.freq):
+                t0 = time.perf_counter()
+                algo.add(vecs=vecs[:query+self.freq], start=query, count=self.freq)
+                ts[ti,1] = ts[ti,1] + time.perf_counter() - t0
+            # Process remove events
+            if self.window > 0 and query + self.freq - size > expired:
+                with self.usage.phase("remove", items=query + self.freq - size - expired):
+                    t0 = time.perf_counter()
+                    algo.remove(vecs=vecs[:query+self.freq], start=expired, count=query + self.freq - size - expired)
+                    self.series["removetime_per_query"][ti] = self.series["removetime_per_query"][ti] + time.perf_counter() - t0
+                expired = query + self.freq - size
             if (query - nq + self.freq) % (nq / self.timings) <= (query - nq) % (nq / self.timings):
                 ts[ti,:2] = ts[ti,:2] * self.timings / nq
+                for values in self.series.values():
+                    values[ti] = values[ti] * self.timings / nq
                 ts[ti,2] = algo.get_memory_usage(cfg.mem_type)
                 ti = ti + 1
         # Return results
+        if self.prefix < 1.0:
+            self.series = {key: values[:ti] for key, values in self.series.items()}
+            return ts[:ti], ids[:idi]
+        return ts, ids
+
+    def evaluate_concurrent(self, algo, cfg):
+        from .concurrent import ConcurrentDriver
+        # Load queries
+        vecs = self.vecs_query()
+        # Initialise parameters
+        nq = int(vecs.shape[0] / 2)
+        ngt = self.sample_size()
+        steps = list(range(nq, nq*2, self.freq))
+        bounds = np.linspace(0, len(steps), self.timings + 1).astype('int')
+        # Initialise results
+        ids = -1 * np.ones([ngt, cfg.topk]).astype('int') # Run all queries, store gt indices only
+        ts = np.zeros([self.timings, 3])
+        rows, idi = -1 * np.ones([len(steps)]).astype('int'), 0
+        for s, query in enumerate(steps):
+            if (query) % (nq / ngt) <= (query - self.freq) % (nq / ngt):
+                rows[s], idi = idi, idi + 1
+        # Define workload
+        def prepare(s):
+            return np.array([vecs[steps[s]]])
+        def run_query(s, q):
+            with self.usage.phase("query", items=1):
+                t0 = time.perf_counter()
+                id = algo.query(vecs=q, topk=cfg.topk, cfg=cfg)
+                algo.queried(time.perf_counter() - t0)
+            if rows[s] >= 0:
+                id = np.array(id)
+                ids[rows[s],:len(id.squeeze())] = id
+        def write(s):
+            with self.usage.phase("update", items=self.freq):
+                algo.add(vecs=vecs[:steps[s]+self.freq], start=steps[s], count=self.freq)
+            if s + 1 in bounds:
+                ts[np.searchsorted(bounds, s + 1) - 1,2] = algo.get_memory_usage(cfg.mem_type)
+        # Run benchmark
+        driver = ConcurrentDriver(steps=len(steps), workers=self.workers)
+        driver.run(algo=algo, prepare=prepare, query=run_query, write=write)
+        for b in range(self.timings):
+            ts[b,0] = np.sum(driver.latency[bounds[b]:bounds[b+1]]) * self.timings / nq
+            ts[b,1] = np.sum(driver.writetime[bounds[b]:bounds[b+1]]) * self.timings / nq
+        self.series = driver.buckets(timings=self.timings, queries=1)
+        # Return results
         return ts, ids
 
     def pregen(self, cfg):
-        # Download data blobs
-        if not self.path.exists():
-            self.path.mkdir(parents=True)
+        # Download data blobs, resuming partial downloads and extracting only the required members
+        members = {f"sift/sift_{name}.fvecs": self.path / f"sift/sift_{name}.fvecs" for name in ["base", "learn"]}
+        if set([self.base, self.learn]) != set(members):
+            # Other collections, eg. SIFT1B, are downloaded separately
+            if not all((self.path / name).exists() for name in [self.base, self.learn]):
+                raise FileNotFoundError(f"Download {self.base} and {self.learn} to {self.path} first")
+        elif not all(path.exists() for path in members.values()):
             tar_path = self.path / "sift.tar.gz"
-            urlretrieve("ftp://ftp.irisa.fr/local/texmex/corpus/sift.tar.gz", tar_path)
-        if (self.path / "sift/sift_base.fvecs").exists() and \
-           (self.path / "sift/sift_learn.fvecs").exists():
-           pass
-        else:
-            with tarfile.open(tar_path, 'r:gz') as f:
-                f.extractall(path=self.path)
+            fetch(url=self.source, dest=tar_path, checksum=self.checksum, mirror=self.mirror)
+            extract_members(tar_path=tar_path, members=members)
         # Check for groundtruth files
-        gt_path = self.path / f"sift/{self.name}_{self.mode}{self.trunc}_{self.freq}_gt.ivecs"
-        if not gt_path.exists():
-            # Initialise bruteforce algorithm
-            from ..algo.linear import LinearANN
-            algo = LinearANN()
-            algo.init(D=self.D(), maxN=2000*self.trunc, cfg=cfg)
-            vecs = self.vecs_base()
-            algo.add(vecs=self.vecs_base(), start=0, count=vecs.shape[0])
-            # Generate groundtruth
-            _, ids = self.evaluate(algo=algo, cfg=cfg)
+        gt_path = self.gt_path()
+        if not gt_path.exists() and cfg.get("groundtruth", True):
+            # Search full precision vectors
+            dtype, self.dtype = self.dtype, "float32"
+            keys = self.gt_keys()
+            if keys is not None:
+                # Derive the groundtruth from exact neighbours cached across modes, frequencies and scales
+                from .gtcache import GroundtruthCache
+                cache = GroundtruthCache(path=(self.path / self.base).parent / f"{self.name}_gtcache{cfg.topk}.ivecs", topk=cfg.topk)
+                ids = -1 * np.ones([self.sample_size(), cfg.topk]).astype('int')
+                ids[:len(keys)] = cache.neighbours(vecs=self.vecs_query(), keys=keys)
+            else:
+                # Initialise bruteforce algorithm
+                from ..algo.linear import LinearANN
+                algo = LinearANN()
+                algo.init(D=self.D(), maxN=2000*self.trunc, cfg=cfg)
+                vecs = self.vecs_base()
+                algo.add(vecs=self.vecs_base(), start=0, count=vecs.shape[0])
+                # Generate groundtruth
+                workers, self.workers = self.workers, 0
+                _, ids = self.evaluate(algo=algo, cfg=cfg)
+                self.workers = workers
             ivecs_write(gt_path, ids)
+            self.dtype = dtype
+
+    def gt_path(self):
+        # The window changes the visible samples of each query, so it is part of the name in the window mode
+        window = f"_{self.window}" if self.mode == "window" else ""
+        return (self.path / self.base).parent / f"{self.name}_{self.mode}{self.trunc}{window}_{self.freq}_gt.ivecs"
+
+    def sample_size(self):
+        if self.trunc < 10:
+            return 100
+        elif self.trunc < 100:
+            return 1000
+        return 10000
+
+    def gt_keys(self):
+        nq = 1000 * self.trunc
+        ngt = self.sample_size()
+        if self.lerp > 0:
+            return None # Queries are modified as the benchmark runs
+        size = int(nq * self.window)
+        keys = []
+        for query in range(nq, nq*2, self.freq):
+            if (query) % (nq / ngt) <= (query - self.freq) % (nq / ngt):
+                keys.append((query, max(query - size, 0) if self.window > 0 else 0, query))
+        return keys[:ngt]
+
+    def files(self):
+        return [self.path / name for name, key in [(self.base, self.keys["base"]), (self.learn, self.keys["learn"])] if key is None]
+
+    def D(self):
+        return vecs_shape(self.path / self.learn, self.keys["learn"])[1]
 
     def vecs_train(self):
-        vec_path = self.path / "sift/sift_learn.fvecs"
+        vec_path = self.path / self.learn
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))
+        return fvecs_load(vec_path, self.shared, self.train_size, self.keys["learn"])[:self.train_size]
 
     def vecs_base(self):
-        vec_path = self.path / "sift/sift_base.fvecs"
+        vec_path = self.path / self.base
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))[:1000*self.trunc,:]
+        return vecs_store(fvecs_load(vec_path, self.shared, 1000*self.trunc, self.keys["base"], self.mmap)[:1000*self.trunc,:], self.dtype)
 
     def vecs_query(self):
-        vec_path = self.path / "sift/sift_base.fvecs"
+        vec_path = self.path / self.base
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))[:2000*self.trunc,:]
+        return vecs_store(fvecs_load(vec_path, self.shared, 2000*self.trunc, self.keys["base"], self.mmap)[:2000*self.trunc,:], self.dtype)
 
     def groundtruth(self):
-        gt_path = self.path / f"sift/{self.name}_{self.mode}{self.trunc}_{self.freq}_gt.ivecs"
+        gt_path = self.gt_path()
         assert gt_path.exists()
         return ivecs_read(fname=str(gt_path))
@@ -3,7 +3,10 @@ from pathlib import Path
 import subprocess
 import numpy as np
 import time
-from ..util import ivecs_read, fvecs_read, ivecs_write, lerp
+from ..util import ivecs_read, ivecs_write, lerp, Usage
+from .store import vecs_store
+from .shared import fvecs_load, writable
+from .fetch import fetch
 
 class OnlineFeatureLearning(BaseDataset):
     """
@@ -23,15 +26,28 @@ class OnlineFeatureLearning(BaseDataset):
         mode: Dataset mode specified by configuration files to enable/disable following attributes
         freq: Relative frequency of index queries and index updates
         lerp: Degree of interpolation between consecutive datapoints [0.0,1.0]
+        workers: Number of query threads run concurrently to the update events, or 0 to alternate on one thread
+        dtype: Precision at which base and query vectors are stored {float32, float16, int8}
+        mirror: Local directory or url prefix holding deep1M_base.fvecs and deep1M_learn.fvecs, instead of generating them
+        checksums: Expected checksums of the mirrored files as "<algorithm>:<hex digest>" keyed by file name
+        prefix: Fraction of the epochs evaluated when alternating on one thread, used to shortlist configurations
+        shared: Map the sample vectors served by serve-data.py instead of loading a private copy
+        mmap: Map the sample vector files and convert rows as they are accessed, for collections larger than memory
+        series: Additional timings collected by evaluate
+        usage: CPU time, context switches and page faults of the query and update events, when enabled
 
     Methods:
         __init__: Initialising internal parameters
         evaluate: Performance on a simulated dataset of updates to a feature embedding space
+        evaluate_concurrent: Performance with queries run concurrently to the update events
         pregen: Download dataset files and computing groundtruth data using exhaustive searches
         vecs_train: Load training set of vectors used to tune ANN algorithms that require it
         vecs_base: Load base set of vectors used to initialise each ANN algorithm
         vecs_query: Load query set of vectors used to evaluate each ANN algorithm
         groundtruth: Load groundtruth indices used to evaluate each ANN algorithm
+        files: Sample vector files that can be served from shared memory
+        sample_size: Number of queries stored for comparison with the groundtruth
+        gt_keys: Query index and visible sample range of each groundtruth row
     """
     
     # Adapted from annbench https://github.com/matsui528/annbench/blob/main/annbench/dataset/deep1m.py
@@ -52,51 +68,124 @@ class OnlineFeatureLearning(BaseDataset):
         self.lerp = 0.0
         if self.mode == 'lerp':
             self.lerp = cfg.data.lerp
+        self.workers = 0
+        if self.mode == 'concurrent':
+            self.workers = cfg.data.workers
+            self.mode = 'default' # Shares the groundtruth of the default mode
+        self.prefix = 1.0
+        self.dtype = cfg.data.get("dtype", "float32")
+        self.mirror = cfg.data.get("mirror", cfg.get("mirror"))
+        self.checksums = cfg.data.get("checksums") or {}
+        self.shared = cfg.data.get("shared", cfg.get("shared", False))
+        self.mmap = cfg.data.get("mmap", cfg.get("chunk") is not None) # Mapped when streamed in chunks, otherwise loaded before the build
+        self.series = {}
+        self.usage = Usage()
 
     def evaluate(self, algo, cfg):
+        if self.workers > 0:
+            return self.evaluate_concurrent(algo, cfg)
+        self.series = {}
         # Load queries
-        vecs = self.vecs_query()
+        vecs = writable(self.vecs_query()) # Samples are modified as the benchmark runs
         # Initialise parameters
         nq = int(vecs.shape[0] / 2)
-        ngt = 10000
-        if self.trunc < 10:
-            ngt = 100
-        elif self.trunc < 100:
-            ngt = 1000
+        ngt = self.sample_size()
         # Initialise results
         ids = -1 * np.ones([ngt, cfg.topk]).astype('int') # Run all queries, store gt indices only
         ts = np.zeros([self.epochs, 3])
         idi = 0
+        epochs = max(int(round(self.epochs * self.prefix)), 1)
         # Run benchmark
-        for epoch in range(self.epochs):
+        for epoch in range(epochs):
             for b,batch in enumerate(range(0, nq, self.batch)):
-                # Update samples
+                # Interpolate the samples of the batch before timing, only one batch is held so the memory sampled is the index
                 target = nq
                 if self.mode == 'lerp':
                     target = target + batch
-                update = lerp(vecs[batch:batch+self.batch], vecs[target:target+self.batch], self.lerp)
+                update = np.ascontiguousarray(lerp(vecs[batch:batch+self.batch], vecs[target:target+self.batch], self.lerp), dtype='float32')
                 # Process queries
-                t0 = time.time()
-                id = algo.query(vecs=np.array(update[:self.batch,:]), topk=cfg.topk, cfg=cfg)
-                ts[epoch,0] = ts[epoch,0] + time.time() - t0
+                with self.usage.phase("query", items=len(update)):
+                    t0 = time.perf_counter()
+                    id = algo.query(vecs=update, topk=cfg.topk, cfg=cfg)
+                    elapsed = time.perf_counter() - t0
+                    ts[epoch,0] = ts[epoch,0] + elapsed
+                algo.queried(elapsed)
                 if b < ngt / self.epochs:
                     id = np.array(id[0])
                     ids[idi,:len(id.squeeze())] = id
                     idi = idi + 1
                 vecs[batch:batch+self.batch] = update
                 # Process update events
-                t0 = time.time()
-                for f in range(batch, batch+self.batch, self.freq):
-                    algo.update(vecs=vecs[:nq], start=f, count=self.freq)
-                ts[epoch,1] = ts[epoch,1] + time.time() - t0
+                with self.usage.phase("update", items=len(update)):
+                    t0 = time.perf_counter()
+                    for f in range(batch, batch+self.batch, self.freq):
+                        algo.update(vecs=vecs[:nq], start=f, count=self.freq)
+                    ts[epoch,1] = ts[epoch,1] + time.perf_counter() - t0
             ts[epoch,:2] = ts[epoch,:2] / nq
             ts[epoch,2] = algo.get_memory_usage(cfg.mem_type)
         # Return results
+        if self.prefix < 1.0:
+            return ts[:epochs], ids[:idi]
+        return ts, ids
+
+    def evaluate_concurrent(self, algo, cfg):
+        from .concurrent import ConcurrentDriver
+        # Load queries
+        vecs = writable(self.vecs_query()) # Samples are modified as the benchmark runs
+        # Initialise parameters
+        nq = int(vecs.shape[0] / 2)
+        ngt = self.sample_size()
+        batches = list(range(0, nq, self.batch))
+        steps = [(epoch, b, batch) for epoch in range(self.epochs) for b, batch in enumerate(batches)]
+        # Initialise results
+        ids = -1 * np.ones([ngt, cfg.topk]).astype('int') # Run all queries, store gt indices only
+        ts = np.zeros([self.epochs, 3])
+        rows, idi = -1 * np.ones([len(steps)]).astype('int'), 0
+        for s, (_, b, _) in enumerate(steps):
+            if b < ngt / self.epochs:
+                rows[s], idi = idi, idi + 1
+        updates = [None] * len(steps)
+        # Define workload
+        def prepare(s):
+            _, _, batch = steps[s]
+            target = nq
+            if self.mode == 'lerp':
+                target = target + batch
+            updates[s] = lerp(vecs[batch:batch+self.batch], vecs[target:target+self.batch], self.lerp)
+            return np.array(updates[s][:self.batch,:])
+        def run_query(s, q):
+            with self.usage.phase("query", items=len(q)):
+                t0 = time.perf_counter()
+                id = algo.query(vecs=q, topk=cfg.topk, cfg=cfg)
+                algo.queried(time.perf_counter() - t0)
+            if rows[s] >= 0:
+                id = np.array(id[0])
+                ids[rows[s],:len(id.squeeze())] = id
+        def write(s):
+            epoch, b, batch = steps[s]
+            vecs[batch:batch+self.batch], updates[s] = updates[s], None
+            with self.usage.phase("update", items=len(vecs[batch:batch+self.batch])):
+                for f in range(batch, batch+self.batch, self.freq):
+                    algo.update(vecs=vecs[:nq], start=f, count=self.freq)
+            if b == len(batches) - 1:
+                ts[epoch,2] = algo.get_memory_usage(cfg.mem_type)
+        # Run benchmark
+        driver = ConcurrentDriver(steps=len(steps), workers=self.workers)
+        driver.run(algo=algo, prepare=prepare, query=run_query, write=write)
+        for epoch in range(self.epochs):
+            ts[epoch,0] = np.sum(driver.latency[epoch*len(batches):(epoch+1)*len(batches)]) / nq
+            ts[epoch,1] = np.sum(driver.writetime[epoch*len(batches):(epoch+1)*len(batches)]) / nq
+        self.series = driver.buckets(timings=self.epochs, queries=self.batch)
+        # Return results
         return ts, ids
 
     def pregen(self, cfg):
         # Download data blobs
         root = str(self.path.resolve())
+        if self.mirror:
+            # Fetch the prepared files from the mirror, resuming partial downloads
+            for name in ["deep1M_base.fvecs", "deep1M_learn.fvecs"]:
+                fetch(url=name, dest=self.path / f"deep1b/{name}", checksum=self.checksums.get(name), mirror=self.mirror)
         if not self.path.exists():
             self.path.mkdir(parents=True)
             subprocess.run(f"git clone https://github.com/matsui528/deep1b_gt.git {root}", shell=True) # https://github.com/matsui528/deep1b_gt#bonus-deep1m
@@ -112,31 +201,66 @@ class OnlineFeatureLearning(BaseDataset):
             subprocess.run(f"python {root}/pickup_vecs.py --src {root}/deep1b/learn/learn_00 --dst {root}/deep1b/deep1M_learn.fvecs --topk 100000", shell=True)
         # Check for groundtruth files
         gt_path = self.path / f"deep1b/{self.name}_{self.mode}{self.trunc}_{self.freq}_gt.ivecs"
-        if not gt_path.exists():
-            # Initialise bruteforce algorithm
-            from ..algo.linear import LinearANN
-            algo = LinearANN()
-            algo.init(D=self.D(), maxN=2000*self.trunc, cfg=cfg)
-            vecs = self.vecs_base()
-            algo.add(vecs=self.vecs_base(), start=0, count=vecs.shape[0])
-            # Generate groundtruth
-            _, ids = self.evaluate(algo=algo, cfg=cfg)
+        if not gt_path.exists() and cfg.get("groundtruth", True):
+            # Search full precision vectors
+            dtype, self.dtype = self.dtype, "float32"
+            keys = self.gt_keys()
+            if keys is not None:
+                # Derive the groundtruth from exact neighbours cached across modes, frequencies and scales
+                from .gtcache import GroundtruthCache
+                cache = GroundtruthCache(path=self.path / f"deep1b/{self.name}_gtcache{cfg.topk}.ivecs", topk=cfg.topk)
+                ids = -1 * np.ones([self.sample_size(), cfg.topk]).astype('int')
+                ids[:len(keys)] = cache.neighbours(vecs=self.vecs_query(), keys=keys)
+            else:
+                # Initialise bruteforce algorithm
+                from ..algo.linear import LinearANN
+                algo = LinearANN()
+                algo.init(D=self.D(), maxN=2000*self.trunc, cfg=cfg)
+                vecs = self.vecs_base()
+                algo.add(vecs=self.vecs_base(), start=0, count=vecs.shape[0])
+                # Generate groundtruth
+                workers, self.workers = self.workers, 0
+                _, ids = self.evaluate(algo=algo, cfg=cfg)
+                self.workers = workers
             ivecs_write(gt_path, ids)
-             
+            self.dtype = dtype
+
+    def sample_size(self):
+        if self.trunc < 10:
+            return 100
+        elif self.trunc < 100:
+            return 1000
+        return 10000
+
+    def gt_keys(self):
+        nq = 1000 * self.trunc
+        ngt = self.sample_size()
+        if self.lerp > 0:
+            return None # Samples are modified as the benchmark runs
+        keys = []
+        for epoch in range(self.epochs):
+            for b, batch in enumerate(range(0, nq, self.batch)):
+                if b < ngt / self.epochs:
+                    keys.append((batch, 0, nq))
+        return keys[:ngt]
+
+    def files(self):
+        return [self.path / "deep1b/deep1M_base.fvecs", self.path / "deep1b/deep1M_learn.fvecs"]
+
     def vecs_train(self):
         vec_path = self.path / "deep1b/deep1M_learn.fvecs"
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))
+        return fvecs_load(vec_path, self.shared)
 
     def vecs_base(self):
         vec_path = self.path / "deep1b/deep1M_base.fvecs"
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))[:1000*self.trunc,:]
+        return vecs_store(fvecs_load(vec_path, self.shared, 1000*self.trunc, mmap=self.mmap)[:1000*self.trunc,:], self.dtype)
 
     def vecs_query(self):
         vec_path = self.path / "deep1b/deep1M_base.fvecs"
         assert vec_path.exists()
-        return fvecs_read(fname=str(vec_path))[:2000*self.trunc,:]
+        return vecs_store(fvecs_load(vec_path, self.shared, 2000*self.trunc, mmap=self.mmap)[:2000*self.trunc,:], self.dtype)
 
     def groundtruth(self):
         gt_path = self.path / f"deep1b/{self.name}_{self.mode}{self.trunc}_{self.freq}_gt.ivecs"
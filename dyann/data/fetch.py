@@ -0,0 +1,126 @@
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+import ftplib
+import hashlib
+import shutil
+import tarfile
+
+# Download helpers for dataset files, so preparing datasets on a build farm is fast and restartable
+
+def resolve(url, mirror=None):
+    """ Find the source for a file, preferring a mirror if it holds a file of the same name
+
+    Parameters:
+        url: Original location of the file, a http(s), ftp or file url or a local path
+        mirror: (optional) local directory or url prefix holding copies of dataset files
+    Returns:
+        The url or local path to fetch from
+    Raises:
+        FileNotFoundError: the mirror lacks the file and the original location is a missing local path
+    """
+    if mirror:
+        name = Path(urlparse(str(url)).path).name
+        parsed = urlparse(str(mirror))
+        if parsed.scheme in ("", "file"):
+            candidate = Path(parsed.path) / name
+            if candidate.exists():
+                return str(candidate)
+        else:
+            return str(mirror).rstrip("/") + "/" + name
+    parsed = urlparse(str(url))
+    if parsed.scheme in ("", "file") and not Path(parsed.path if parsed.scheme else str(url)).exists():
+        # Files only distributed through mirrors are named without a source url
+        raise FileNotFoundError(f"{Path(parsed.path).name} not found in mirror {mirror} and no source url to download it from")
+    return str(url)
+
+def checksum_file(path, algorithm):
+    """Hex digest of a file computed in chunks"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def verify(path, checksum):
+    """ Check a file against a checksum of the form "<algorithm>:<hex digest>", eg. "sha256:ab12..."
+
+    Returns:
+        True if the file matches or no checksum was given
+    """
+    if not checksum:
+        return True
+    algorithm, digest = str(checksum).split(":", 1)
+    return checksum_file(path, algorithm) == digest.lower()
+
+def fetch(url, dest, checksum=None, mirror=None, chunk=1 << 20):
+    """ Download a file, resuming a previous partial download and verifying its checksum
+
+    Partial downloads are kept next to the destination with a .part suffix until complete and verified.
+
+    Parameters:
+        url: Location of the file, a http(s), ftp or file url or a local path
+        dest: Destination path
+        checksum: (optional) expected checksum of the form "<algorithm>:<hex digest>"
+        mirror: (optional) local directory or url prefix searched first for a file of the same name
+        chunk: Number of bytes copied at a time
+    """
+    dest = Path(dest)
+    if dest.exists() and verify(dest, checksum):
+        return
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    source = resolve(url, mirror)
+    parsed = urlparse(source)
+    offset = part.stat().st_size if part.exists() else 0
+    if parsed.scheme in ("", "file"):
+        with open(parsed.path if parsed.scheme else source, "rb") as src, open(part, "ab") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, chunk)
+    elif parsed.scheme == "ftp":
+        with ftplib.FTP(parsed.hostname) as ftp, open(part, "ab") as dst:
+            ftp.login(parsed.username or "anonymous", parsed.password or "")
+            ftp.retrbinary(f"RETR {parsed.path}", dst.write, blocksize=chunk, rest=offset or None)
+    else:
+        request = Request(source, headers={"Range": f"bytes={offset}-"} if offset else {})
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            if e.code != 416: # Range not satisfiable, the partial file is already complete
+                raise
+            response = None
+        if response is not None:
+            with response, open(part, "ab" if response.status == 206 else "wb") as dst:
+                shutil.copyfileobj(response, dst, chunk)
+    if not verify(part, checksum):
+        part.unlink()
+        raise ValueError(f"Checksum mismatch for {source}, removed the partial download")
+    part.replace(dest)
+
+def extract_members(tar_path, members):
+    """ Stream selected members out of a tarball directly into their target files
+
+    The archive is read sequentially and closed as soon as every requested member has been written,
+    so the rest of a large compressed archive is never decompressed.
+
+    Parameters:
+        tar_path: Path of the (optionally compressed) tarball
+        members: Dictionary mapping member names in the archive to destination paths
+    """
+    pending = {name: Path(path) for name, path in members.items() if not Path(path).exists()}
+    if len(pending) == 0:
+        return
+    with tarfile.open(tar_path, "r|*") as tar:
+        for info in tar:
+            if info.name not in pending:
+                continue
+            dest = pending.pop(info.name)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            part = dest.with_name(dest.name + ".part")
+            with tar.extractfile(info) as src, open(part, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            part.replace(dest)
+            if len(pending) == 0:
+                break
+    assert len(pending) == 0, f"Members {list(pending)} not found in {tar_path}"
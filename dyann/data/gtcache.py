@@ -0,0 +1,62 @@
+from pathlib import Path
+import numpy as np
+import faiss
+from ..util import ivecs_read, ivecs_write
+
+class GroundtruthCache(object):
+    """
+    A class caching exact neighbours of each query against the samples visible when it was issued
+
+    Groundtruth files of different modes, frequencies and scales mostly sample the same queries against the same
+    prefixes of a dataset, so each (query index, visible range) is searched once and reused by all of them.
+
+    Attributes:
+        path: ivecs file with one row per entry [query, lo, hi, ids...]
+        topk: Neighbourhood set size stored per entry
+        entries: Dictionary mapping (query, lo, hi) to the indices of the topk exact neighbours
+
+    Methods:
+        __init__: Load any existing entries
+        neighbours: Return the exact neighbours for a list of entries, computing and saving those missing
+    """
+
+    def __init__(self, path, topk):
+        self.path = Path(path)
+        self.topk = topk
+        self.entries = {}
+        if self.path.exists():
+            for row in ivecs_read(fname=str(self.path)):
+                self.entries[tuple(int(x) for x in row[:3])] = row[3:]
+
+    def neighbours(self, vecs, keys):
+        """
+        A method for looking up exact neighbours
+
+        Parameters:
+            vecs: Full precision matrix of samples indexed by the entries
+            keys: List of (query, lo, hi) tuples, the index of a query sample and the range of samples visible to it
+        Returns:
+            A matrix with the topk exact neighbour indices of each entry, padded with -1
+        """
+        missing = sorted(set(keys) - set(self.entries), key=lambda key: (key[1], key[2], key[0]))
+        if len(missing) > 0:
+            faiss.omp_set_num_threads(1)
+            # Entries sharing a visible range are searched as one batch
+            groups = {}
+            for key in missing:
+                groups.setdefault(key[1:], []).append(key)
+            for (lo, hi), group in groups.items():
+                queries = np.ascontiguousarray(vecs[[key[0] for key in group]], dtype='float32')
+                _, ids = faiss.knn(queries, np.ascontiguousarray(vecs[lo:hi], dtype='float32'), min(self.topk, hi - lo))
+                for key, row in zip(group, ids):
+                    self.entries[key] = -1 * np.ones([self.topk]).astype('int')
+                    self.entries[key][:len(row)] = np.where(row < 0, row, row + lo)
+            self.save()
+        return np.array([self.entries[key] for key in keys]).reshape(len(keys), self.topk)
+
+    def save(self):
+        keys = sorted(self.entries)
+        rows = np.array([list(key) + list(self.entries[key]) for key in keys]).reshape(len(keys), 3 + self.topk)
+        part = self.path.with_name(self.path.name + ".part")
+        ivecs_write(str(part), rows)
+        part.replace(self.path)
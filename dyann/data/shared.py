@@ -0,0 +1,84 @@
+from pathlib import Path
+import hashlib
+import logging
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from ..util import vecs_load, vecs_mmap
+from .store import MappedVecs
+
+log = logging.getLogger(__name__)
+
+# Blocks are laid out as a header of two int64 values (rows, dimensions) followed by the float32 samples
+HEADER = 16
+# Blocks attached by this process, kept open for as long as their arrays may be referenced
+_attached = {}
+
+def block_name(path):
+    """Shared memory name of a served file, derived from its absolute path so that every process agrees on it"""
+    return "dyann_" + hashlib.sha1(str(Path(path).resolve()).encode()).hexdigest()[:16]
+
+def publish(path):
+    """ Copy a vector file into a new shared memory block as float32
+
+    Parameters:
+        path: Location of the fvecs, ivecs or bvecs file
+    Returns:
+        The shared memory block, which the caller must keep open and unlink when done serving
+    """
+    vecs = vecs_load(fname=str(path))
+    shm = shared_memory.SharedMemory(name=block_name(path), create=True, size=HEADER + vecs.nbytes)
+    np.ndarray([2], dtype='int64', buffer=shm.buf)[:] = vecs.shape
+    np.ndarray(vecs.shape, dtype='float32', buffer=shm.buf, offset=HEADER)[:] = vecs
+    return shm
+
+def attach(path):
+    """ Map the served copy of an fvecs file as a read-only array
+
+    Parameters:
+        path: Location of the fvecs file
+    Returns:
+        The array shared with the server, or None when the file is not served
+    """
+    name = block_name(path)
+    if name not in _attached:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        resource_tracker.unregister(shm._name, "shared_memory") # The server owns the block, do not unlink it on exit
+        shape = tuple(int(x) for x in np.ndarray([2], dtype='int64', buffer=shm.buf))
+        vecs = np.ndarray(shape, dtype='float32', buffer=shm.buf, offset=HEADER)
+        vecs.flags.writeable = False
+        _attached[name] = (shm, vecs)
+    return _attached[name][1]
+
+def fvecs_load(path, shared, stop=None, key=None, mmap=False):
+    """ Attach the served copy of a vector file when shared, falling back to reading its leading rows from disk
+
+    Parameters:
+        path: Location of the fvecs, ivecs, bvecs or HDF5 file
+        shared: Attach the copy served by serve-data.py if there is one
+        stop: Number of leading rows required, or None for the whole file
+        key: Name of the HDF5 dataset holding the rows, HDF5 files are never served
+        mmap: Map the file instead of loading it, for collections larger than memory
+    Returns:
+        A float32 matrix holding at least the required rows. When mapped, fvecs files are a read-only strided view and
+        bvecs or ivecs files are converted as rows are accessed, so only the rows in use are resident
+    """
+    if shared and key is None:
+        vecs = attach(path)
+        if vecs is not None:
+            return vecs
+        log.info(f"{path} is not served, reading it from disk")
+    if not mmap or Path(path).suffix in (".hdf5", ".h5"):
+        return vecs_load(fname=str(path), stop=stop, key=key) # Compressed or chunked datasets cannot be mapped
+    rows = vecs_mmap(str(path))[:stop]
+    return rows if rows.dtype == np.float32 else MappedVecs(rows)
+
+def writable(vecs):
+    """Copy arrays shared read-only with other processes or mapped from disk before the benchmark modifies them"""
+    if isinstance(vecs, np.ndarray) and not vecs.flags.writeable:
+        return np.array(vecs) # Contiguous copy of a shared or mapped file
+    if isinstance(vecs, MappedVecs):
+        return np.asarray(vecs)
+    return vecs
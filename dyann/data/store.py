@@ -0,0 +1,122 @@
+import numpy as np
+
+class QuantizedVecs(object):
+    """
+    A matrix of sample vectors stored at reduced precision and decoded to float32 on access
+
+    Indexing with a single slice of rows returns a view sharing the stored codes, so that prefixes of the dataset
+    can be handed to ANN algorithms without decoding, while any other index returns a decoded numpy array.
+    Conversion with np.asarray decodes the whole matrix, which is how faiss, hnswlib and sklearn consume it.
+
+    Attributes:
+        codes: Stored codes as float16, or int8 with per-dimension scales and offsets
+        scale: Per-dimension step between consecutive int8 codes
+        offset: Per-dimension value of the int8 code -128
+        shape: Shape of the decoded matrix
+        dtype: Type of the decoded values
+        nbytes: Memory used by the stored codes
+
+    Methods:
+        __init__: Encode a float32 matrix as either float16 or int8
+        decode: Convert codes to float32
+        encode: Convert float32 values to codes
+    """
+
+    def __init__(self, vecs, dtype, scale=None, offset=None):
+        assert dtype in ("float16", "int8")
+        self.dtype = np.dtype('float32')
+        self.scale, self.offset = scale, offset
+        if isinstance(vecs, np.ndarray) and vecs.dtype == np.dtype(dtype):
+            self.codes = vecs # Already encoded, eg. a view of another store
+            return
+        if dtype == "int8" and scale is None:
+            lo, hi = np.min(vecs, axis=0), np.max(vecs, axis=0)
+            self.scale = np.maximum(hi - lo, 1e-12).astype('float32') / 255
+            self.offset = lo.astype('float32')
+        self.codes = np.empty(vecs.shape, dtype=dtype)
+        for start in range(0, vecs.shape[0], 65536): # Encode in chunks to bound the float32 temporaries
+            self.codes[start:start+65536] = self.encode(vecs[start:start+65536])
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def decode(self, codes):
+        if self.scale is None:
+            return codes.astype('float32')
+        return (codes.astype('float32') + 128) * self.scale + self.offset
+
+    def encode(self, vecs):
+        if self.scale is None:
+            return np.asarray(vecs, dtype='float16')
+        return np.clip(np.rint((np.asarray(vecs, dtype='float32') - self.offset) / self.scale) - 128, -128, 127).astype('int8')
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return QuantizedVecs(self.codes[key], str(self.codes.dtype), self.scale, self.offset)
+        if isinstance(key, tuple):
+            rows = self.decode(self.codes[key[0]])
+            return rows[(slice(None),) * (rows.ndim - 1) + key[1:]]
+        return self.decode(self.codes[key])
+
+    def __setitem__(self, key, value):
+        self.codes[key] = self.encode(value)
+
+    def __iter__(self):
+        for codes in self.codes:
+            yield self.decode(codes)
+
+    def __array__(self, dtype=None, copy=None):
+        vecs = self.decode(self.codes)
+        return vecs if dtype is None else vecs.astype(dtype)
+
+class MappedVecs(object):
+    """
+    A matrix of integer sample vectors mapped from a bvecs or ivecs file and converted to float32 on access
+
+    Indexed like QuantizedVecs, a single slice of rows returns a view of the mapping and any other index reads and
+    converts only the selected rows, so the file is never held in memory as float32.
+
+    Attributes:
+        rows: Strided view of the mapped file
+        shape: Shape of the matrix
+        dtype: Type of the converted values
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.dtype = np.dtype('float32')
+
+    @property
+    def shape(self):
+        return self.rows.shape
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and all(k == slice(None) for k in key[1:]):
+            key = key[0] # Rows with every dimension, eg. vecs[:n,:]
+        if isinstance(key, slice):
+            return MappedVecs(self.rows[key])
+        return np.asarray(self.rows[key], dtype='float32')
+
+    def __iter__(self):
+        for row in self.rows:
+            yield row.astype('float32')
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.rows, dtype='float32' if dtype is None else dtype)
+
+def vecs_store(vecs, dtype):
+    """Keep a float32 matrix as is, or encode it at the reduced precision given by dtype"""
+    if dtype is None or dtype == "float32":
+        return vecs
+    return QuantizedVecs(vecs, dtype)
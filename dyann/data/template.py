@@ -54,6 +54,7 @@ class TemplateDataset(BaseDataset):
             # t0 = time.time()
             # ids[query,:] = algo.query(vecs=vecs[query]), topk=cfg.topk, cfg=cfg)
             # ts[query,0] = time.time() - t0
+            # algo.queried(ts[query,0]) # Query time between events, used when skips is auto
             
             # TODO Process dynamic events to update the index
             # eg.
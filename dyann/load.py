@@ -0,0 +1,86 @@
+import asyncio
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+def arrivals_poisson(rate, count, seed=0):
+    """Arrival times of a Poisson process with the given rate in queries per second"""
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.exponential(1.0 / rate, count))
+
+def arrivals_trace(trace, rate, count):
+    """Arrival times replaying the inter-arrival pattern of a trace, rescaled to the given mean rate"""
+    gaps = np.diff(np.sort(np.asarray(trace, dtype='float64')))
+    assert len(gaps) > 0 and np.mean(gaps) > 0
+    gaps = np.resize(gaps, count) * (1.0 / rate) / np.mean(gaps)
+    return np.cumsum(gaps)
+
+async def open_loop(algo, vecs, topk, cfg, arrivals, executor):
+    """ Issue queries at scheduled arrival times regardless of when earlier queries complete
+
+    Parameters:
+        algo: An ANN algorithm inheriting from BaseANN
+        vecs: A matrix of query vectors, cycled through if there are fewer than arrivals
+        topk: The neighbourhood set size being evaluated
+        cfg: OmegaConf object with current search properties
+        arrivals: Scheduled arrival time of each query in seconds from the start
+        executor: Executor running the queries
+    Returns:
+        latency: Time from the scheduled arrival to the completion of each query
+        elapsed: Time from the start to the completion of the last query
+    """
+    loop = asyncio.get_running_loop()
+    latency = np.zeros([len(arrivals)])
+    start = time.perf_counter()
+    def run(i):
+        algo.query(vecs=vecs[i % vecs.shape[0]:i % vecs.shape[0] + 1], topk=topk, cfg=cfg)
+        latency[i] = time.perf_counter() - start - arrivals[i]
+    futures = []
+    for i, arrival in enumerate(arrivals):
+        delay = start + arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        futures.append(loop.run_in_executor(executor, run, i))
+    await asyncio.gather(*futures)
+    return latency, time.perf_counter() - start
+
+def sweep(algo, vecs, cfg, load):
+    """ Sweep query arrival rates geometrically until the algorithm saturates
+
+    Parameters:
+        algo: An ANN algorithm inheriting from BaseANN with a built index
+        vecs: A matrix of query vectors
+        cfg: OmegaConf object with current search properties
+        load: OmegaConf object with the load generator properties
+    Returns:
+        A list with the offered and achieved throughput and latency percentiles at each rate
+    """
+    trace = None
+    if load.arrivals == "trace":
+        trace = np.loadtxt(load.trace, dtype='float64', ndmin=1)
+    ret = []
+    rate = load.rate_start
+    algo.lock.enabled = load.workers > 1
+    with ThreadPoolExecutor(max_workers=load.workers) as executor:
+        while rate <= load.rate_max:
+            count = max(int(rate * load.duration), 1)
+            if trace is None:
+                arrivals = arrivals_poisson(rate=rate, count=count, seed=load.seed)
+            else:
+                arrivals = arrivals_trace(trace=trace, rate=rate, count=count)
+            latency, elapsed = asyncio.run(open_loop(algo, vecs, cfg.topk, cfg, arrivals, executor))
+            throughput = count / elapsed
+            ret.append({
+                "rate": float(rate),
+                "throughput": float(throughput),
+                "latency_mean": float(np.mean(latency)),
+                "latency_p50": float(np.percentile(latency, 50)),
+                "latency_p99": float(np.percentile(latency, 99)),
+                "latency_p999": float(np.percentile(latency, 99.9)),
+            })
+            # Stop once the queue grows faster than it drains
+            if throughput < (1.0 - load.saturation) * rate:
+                break
+            rate = rate * load.rate_step
+    algo.lock.enabled = False
+    return ret
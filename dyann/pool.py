@@ -0,0 +1,109 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import weakref
+import numpy as np
+import psutil
+
+class QueryPool(object):
+    """ Read-only replicas of a built index searched in parallel by forked worker processes
+
+    Each worker is forked after the index is built, so the replicas share its pages copy-on-write and only the pages
+    written while searching, eg. visited lists or reference counts, become private to a replica. Query batches are
+    handed to whichever worker is idle over a pipe. The index must not be modified while the pool is open, and
+    algorithms that run their own worker processes, eg. shard and shadow, cannot be replicated this way.
+
+    Usage:
+        pool = QueryPool(algo=algo, replicas=4)
+        ids, latency, elapsed = pool.run(vecs=vecs, topk=topk, cfg=cfg, batch=10)
+        pool.memory()
+        pool.close()
+    """
+
+    def __init__(self, algo, replicas):
+        context = multiprocessing.get_context("fork")
+        self.pipes, self.workers = [], []
+        for _ in range(replicas):
+            parent, child = context.Pipe()
+            worker = context.Process(target=_serve, args=(child, algo), daemon=True)
+            worker.start()
+            child.close()
+            self.pipes.append(parent)
+            self.workers.append(worker)
+        self.finalizer = weakref.finalize(self, _shutdown, self.pipes, self.workers)
+
+    def run(self, vecs, topk, cfg, batch):
+        """ Search all queries, keeping every replica busy with one batch at a time
+
+        Parameters:
+            vecs: A matrix of query vectors
+            topk: The neighbourhood set size being evaluated
+            cfg: OmegaConf object with current search properties
+            batch: Number of queries sent to a replica at a time
+        Returns:
+            ids: Neighbour indices of each query
+            latency: Search time of each batch measured by the replica
+            elapsed: Time from sending the first batch to receiving the last results
+        """
+        starts = list(range(0, vecs.shape[0], batch))
+        ids = -1 * np.ones([vecs.shape[0], topk]).astype('int64')
+        latency = np.zeros([len(starts)])
+        pending, sent = {}, 0
+        t0 = time.perf_counter()
+        for pipe in self.pipes[:len(starts)]:
+            pipe.send(("query", sent, np.ascontiguousarray(vecs[starts[sent]:starts[sent]+batch]), topk, cfg))
+            pending[pipe], sent = sent, sent + 1
+        while len(pending) > 0:
+            for pipe in multiprocessing.connection.wait(list(pending)):
+                b, result, seconds = pipe.recv()
+                if isinstance(result, str):
+                    raise RuntimeError(f"Replica search failed\n{result}")
+                result = np.array(result).astype('int64').reshape(-1, topk)
+                ids[starts[b]:starts[b]+len(result)], latency[b] = result, seconds
+                del pending[pipe]
+                if sent < len(starts):
+                    pipe.send(("query", sent, np.ascontiguousarray(vecs[starts[sent]:starts[sent]+batch]), topk, cfg))
+                    pending[pipe], sent = sent, sent + 1
+        return ids, latency, time.perf_counter() - t0
+
+    def memory(self):
+        """Resident and unique set sizes of each replica, the unique pages are those copied on write"""
+        for pipe in self.pipes:
+            pipe.send(("memory",))
+        return [pipe.recv() for pipe in self.pipes]
+
+    def close(self):
+        self.finalizer()
+
+def _shutdown(pipes, workers):
+    for pipe in pipes:
+        try:
+            pipe.send(("close",))
+        except (BrokenPipeError, OSError):
+            pass
+    for worker in workers:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
+
+def _serve(pipe, algo):
+    """Worker process loop searching its copy-on-write replica of the index"""
+    import traceback
+    process = psutil.Process(os.getpid())
+    while True:
+        message = pipe.recv()
+        if message[0] == "close":
+            break
+        if message[0] == "memory":
+            info = process.memory_full_info()
+            pipe.send({"rss": info.rss, "uss": info.uss})
+        elif message[0] == "query":
+            _, b, vecs, topk, cfg = message
+            try:
+                t0 = time.perf_counter()
+                ids = algo.query(vecs=vecs, topk=topk, cfg=cfg)
+                pipe.send((b, np.asarray(ids), time.perf_counter() - t0))
+            except Exception:
+                pipe.send((b, traceback.format_exc(), 0.0))
+    pipe.close()
@@ -1,7 +1,12 @@
 import numpy as np
+import threading
+import time
+import resource
+from pathlib import Path
 
 def lerp(vecs, target, frac):
     """Linerly interpolates between two vectors"""
+    vecs, target = np.asarray(vecs), np.asarray(target)
     assert vecs.shape[0] == target.shape[0]
     if len(vecs.shape) == 2:
         assert vecs.shape[1] == target.shape[1]
@@ -28,6 +33,154 @@ def recall_at_r(I, gt, r):
         n_ok.append(len(list(set(I[i, :]) & set(gt[i, :r]))))
     return n_ok
 
+def rerank(vecs, candidates, lookup, topk):
+    """ Re-rank candidate neighbour indices by their exact distance to each query, for all queries in one batch
+
+    Parameters:
+        vecs: Query vectors
+        candidates: Candidate indices of each query, negative for none, duplicates are ignored
+        lookup: Function returning the sample vectors of a sorted array of unique indices
+        topk: Neighbourhood set size returned
+    Returns:
+        The topk nearest candidate indices of each query, padded with -1
+    """
+    vecs = np.asarray(vecs, dtype='float32').reshape(len(vecs), -1)
+    candidates = np.sort(np.asarray(candidates, dtype='int64').reshape(len(vecs), -1), axis=1)
+    valid = candidates >= 0
+    valid[:,1:] &= candidates[:,1:] != candidates[:,:-1] # Duplicates are adjacent once sorted
+    dists = np.full(candidates.shape, np.inf, dtype='float32')
+    if np.any(valid):
+        # Each sample is looked up once for the batch, in index order
+        unique, inverse = np.unique(candidates[valid], return_inverse=True)
+        rows = np.asarray(lookup(unique), dtype='float32').reshape(len(unique), -1)[inverse]
+        diffs = rows - np.repeat(vecs, np.sum(valid, axis=1), axis=0)
+        dists[valid] = np.einsum('ij,ij->i', diffs, diffs)
+    order = np.argsort(dists, axis=1, kind="stable")[:,:topk]
+    ids = -1 * np.ones([len(vecs), topk]).astype('int64')
+    ids[:,:order.shape[1]] = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(candidates, order, axis=1), -1)
+    return ids
+
+class ReadWriteLock(object):
+    """ Lock shared by concurrent readers or held by a single writer
+
+    Locking is a no-op until enabled, so that single threaded benchmarks pay no synchronisation cost.
+    Waiting writers take precedence over new readers to avoid starving the update thread.
+
+    Usage:
+        with lock.read: ...
+        with lock.write: ...
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.cond = threading.Condition()
+        self.readers, self.writers, self.writing = 0, 0, False
+        self.read = _Context(self.acquire_read, self.release_read)
+        self.write = _Context(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        if not self.enabled:
+            return
+        with self.cond:
+            while self.writing or self.writers > 0:
+                self.cond.wait()
+            self.readers = self.readers + 1
+
+    def release_read(self):
+        if not self.enabled:
+            return
+        with self.cond:
+            self.readers = self.readers - 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        if not self.enabled:
+            return
+        with self.cond:
+            self.writers = self.writers + 1
+            while self.writing or self.readers > 0:
+                self.cond.wait()
+            self.writers = self.writers - 1
+            self.writing = True
+
+    def release_write(self):
+        if not self.enabled:
+            return
+        with self.cond:
+            self.writing = False
+            self.cond.notify_all()
+
+class _Context(object):
+    """Context manager calling a pair of acquire and release functions"""
+
+    def __init__(self, acquire, release):
+        self.acquire, self.release = acquire, release
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+class Usage(object):
+    """ Wall time, CPU time, context switches and page faults accumulated over named phases
+
+    Accounting is a no-op until enabled, so that the benchmarks only pay for it when the results are stored.
+    Process CPU time and the getrusage counters cover all threads, so phases overlapping on several threads,
+    eg. concurrent queries, count the work of the other threads too. Thread CPU time only counts the calling thread.
+
+    Usage:
+        with usage.phase("query", items=1): ...
+        usage.results()
+    """
+
+    fields = ["wall", "cpu_process", "cpu_thread", "ctx_voluntary", "ctx_involuntary", "faults_minor", "faults_major"]
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.mutex = threading.Lock()
+        self.totals = {}
+        self.null = _Context(lambda: None, lambda: None)
+
+    def phase(self, name, items=1):
+        if not self.enabled:
+            return self.null
+        return _Phase(self, name, items)
+
+    def snapshot(self):
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        return np.array([time.perf_counter(), time.process_time(), time.thread_time(), ru.ru_nvcsw, ru.ru_nivcsw, ru.ru_minflt, ru.ru_majflt])
+
+    def accumulate(self, name, items, delta):
+        with self.mutex:
+            if name not in self.totals:
+                self.totals[name] = np.zeros([len(self.fields) + 1])
+            self.totals[name][:-1] = self.totals[name][:-1] + delta
+            self.totals[name][-1] = self.totals[name][-1] + items
+
+    def results(self):
+        """Totals of each phase, with the number of items processed"""
+        return {name: {**{field: float(value) for field, value in zip(self.fields, totals)}, "items": int(totals[-1])} for name, totals in self.totals.items()}
+
+    def per_cpu_second(self, name):
+        """Items processed in a phase per second of process CPU time"""
+        if name not in self.totals or self.totals[name][1] <= 0:
+            return 0.0
+        return float(self.totals[name][-1] / self.totals[name][1])
+
+class _Phase(object):
+    """Context manager adding the usage between entry and exit to a phase"""
+
+    def __init__(self, usage, name, items):
+        self.usage, self.name, self.items = usage, name, items
+
+    def __enter__(self):
+        self.start = self.usage.snapshot()
+
+    def __exit__(self, *args):
+        self.usage.accumulate(self.name, self.items, self.usage.snapshot() - self.start)
+
 # The following fuinctions are from annbench
 # https://github.com/matsui528/annbench/blob/main/annbench/util.py
 
@@ -57,4 +210,78 @@ def ivecs_write(fname, m):
     m1 = np.empty((n, d + 1), dtype='int32')
     m1[:, 0] = d
     m1[:, 1:] = m
-    m1.tofile(fname)
\ No newline at end of file
+    m1.tofile(fname)
+
+# Streaming readers, files are memory-mapped so only the rows of each chunk are read into memory
+
+VECS_DTYPES = {".fvecs": 'float32', ".ivecs": 'int32', ".bvecs": 'uint8'}
+
+def vecs_mmap(fname):
+    """ Map an fvecs, ivecs or bvecs file as a read-only matrix without reading it
+
+    Parameters:
+        fname: Location of the file, the suffix selects the component type
+    Returns:
+        A strided view of the rows that skips the dimension header of each row
+    """
+    dtype = np.dtype(VECS_DTYPES.get(Path(fname).suffix, 'float32')) # Deep1B shards such as base_00 have no suffix
+    d = int(np.fromfile(fname, dtype='int32', count=1)[0])
+    raw = np.memmap(fname, dtype='uint8', mode='r')
+    row = 4 + d * dtype.itemsize
+    return np.ndarray((raw.shape[0] // row, d), dtype=dtype, buffer=raw, offset=4, strides=(row, dtype.itemsize))
+
+def _h5py(fname):
+    """HDF5 files are optional, import h5py only when one is read"""
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError(f"Reading {fname} requires h5py, install it with pip install h5py")
+    return h5py
+
+def vecs_chunks(fname, chunk, start=0, stop=None, key=None):
+    """ Stream the rows of an fvecs, ivecs, bvecs or HDF5 file in fixed-size chunks
+
+    Parameters:
+        fname: Location of the file, HDF5 files are read with h5py
+        chunk: Number of rows in each chunk
+        start: First row read
+        stop: Row after the last row read, or None for the end of the file
+        key: Name of the HDF5 dataset holding the rows, eg. train or test for ann-benchmarks files
+    Yields:
+        The index of the first row of each chunk and a copy of its rows
+    """
+    if Path(fname).suffix in (".hdf5", ".h5"):
+        with _h5py(fname).File(fname, "r") as f:
+            rows = f[key]
+            stop = rows.shape[0] if stop is None else min(stop, rows.shape[0])
+            for s in range(start, stop, chunk):
+                yield s, rows[s:min(s+chunk, stop)]
+    else:
+        rows = vecs_mmap(fname)
+        stop = rows.shape[0] if stop is None else min(stop, rows.shape[0])
+        for s in range(start, stop, chunk):
+            yield s, np.array(rows[s:min(s+chunk, stop)])
+
+def vecs_shape(fname, key=None):
+    """Number of rows and dimensions of an fvecs, ivecs, bvecs or HDF5 file, read from its header"""
+    if Path(fname).suffix in (".hdf5", ".h5"):
+        with _h5py(fname).File(fname, "r") as f:
+            return tuple(f[key].shape)
+    return vecs_mmap(fname).shape
+
+def vecs_load(fname, stop=None, key=None, chunk=65536):
+    """ Read the leading rows of a vector file as float32, converting one chunk at a time
+
+    Parameters:
+        fname: Location of an fvecs, ivecs, bvecs or HDF5 file
+        stop: Number of rows read, or None for the whole file
+        key: Name of the HDF5 dataset holding the rows
+        chunk: Number of rows converted at a time, bounding the temporaries
+    Returns:
+        A float32 matrix of the rows
+    """
+    rows, d = vecs_shape(fname, key)
+    vecs = np.empty([rows if stop is None else min(stop, rows), d], dtype='float32')
+    for s, rows in vecs_chunks(fname, chunk, stop=vecs.shape[0], key=key):
+        vecs[s:s+len(rows)] = rows
+    return vecs
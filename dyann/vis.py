@@ -96,4 +96,37 @@ def draw_series(lines, ylabel, title, filename, with_ctrl, width, height):
     plt.legend(handles=legend, bbox_to_anchor=(1.05, 1.0), loc="upper left")
     plt.title(title)
     plt.savefig(filename, bbox_inches='tight')
-    plt.cla()
\ No newline at end of file
+    plt.cla()
+
+def draw_heatmap(matrix, xticks, yticks, xlabel, ylabel, title, filename, width, height):
+    """
+    Visualize a table of measurements as a heatmap annotated with each value and save it as an image
+    Args:
+        matrix (list): rows of values, NaN for cells that were not measured
+        xticks (list): labels of the columns
+        yticks (list): labels of the rows
+        xlabel (str): label of x-axis
+        ylabel (str): label of y-axis
+        title (str): title of the result_img
+        filename (str): output file name of image
+        width (int): width of the figure
+        height (int): height of the figure
+    """
+    values = np.array(matrix, dtype=float)
+
+    plt.figure(figsize=(width, height))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plt.imshow(np.log10(values), cmap="viridis", aspect="auto", origin="lower")
+    plt.colorbar(label="log10")
+    for i in range(values.shape[0]):
+        for j in range(values.shape[1]):
+            if not np.isnan(values[i,j]):
+                plt.annotate(text=f"{values[i,j]:.3g}", xy=(j, i), ha="center", va="center", color="w")
+
+    plt.xticks(range(len(xticks)), xticks)
+    plt.yticks(range(len(yticks)), yticks)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.savefig(filename, bbox_inches='tight')
+    plt.clf()
@@ -33,7 +33,7 @@ def main():
         for p_algo in sorted(p_dataset.glob("*")):
             if p_algo.is_file() or not p_algo.name in base_cfg.algo:
                 continue
-            for p_result in sorted(p_algo.glob("*")):
+            for p_result in sorted(p_algo.glob("result-*")): # Skip load and tuning logs
                 if not p_result.is_file():
                     continue
                 log.info(f"Reading {p_result}")
@@ -41,6 +41,9 @@ def main():
                     ret_all = yaml.safe_load(f)
                 for ret in ret_all:
                     # "ret" is for one param_build. "ret" contains several results for each param_query
+                    if any(len(r["recall"]) == 0 for r in ret):
+                        log.info(f"Skipping {stringify_dict(d=ret[0]['param_build'])} - run without groundtruth")
+                        continue
                     recall, runtime, buildtime, searchtime, ctrls = [], [], [], [], []
                     for r in ret:
                         recall.append(r["recall"][0]) #top50
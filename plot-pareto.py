@@ -39,7 +39,7 @@ def main():
             line = { "xs": [], "ys": [], "ctrls": [], "label": algo }
             best = 0
             line_all = []
-            for result in sorted(out.glob(f"{dataset}/{algo}/*")):
+            for result in sorted(out.glob(f"{dataset}/{algo}/result-*")): # Skip load and tuning logs
                 if not result.is_file():
                     continue
                 log.info(f"Reading {result}")
@@ -47,6 +47,8 @@ def main():
                     ret_all = yaml.safe_load(f)
                 for ret in ret_all: # "ret" is for one param_build. "ret" contains several results for each param_query
                     for r in ret:
+                        if len(r["recall"]) == 0:
+                            continue # Run without groundtruth
                         recall = np.mean(np.array(r["recall"][topi]) / topk)
                         runtime = np.mean(1.0 / np.array(r["runtime_per_query"]))
                         if len(max_pareto) > 0:
@@ -0,0 +1,120 @@
+# File and data handling 
+from omegaconf import DictConfig, OmegaConf
+import logging
+from pathlib import Path
+import yaml
+import numpy as np
+from datetime import datetime
+# Internal functions
+from dyann.algo.proxy import instantiate_algorithm
+from dyann.data.proxy import instantiate_dataset
+from dyann.load import sweep
+from dyann.util import stringify_dict
+from dyann.vis import draw_loglog
+from run import pregenerate
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/load.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.load(cfg_path)
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+    timestamp = f"{datetime.now().strftime('%y-%m-%d-%H-%M-%S')}"
+    img = Path(base_cfg.img_out)
+    img.mkdir(exist_ok=True, parents=True)  # Make sure the img directory exists
+
+    # Sweep datasets
+    for data_name in base_cfg.data:
+        lines = []
+        # Sweep algorithms
+        for algo_name in base_cfg.algo:
+            # Instantiate a search algorithm class
+            cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_build.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+                continue
+            algo_cfg = OmegaConf.create(base_cfg)
+            algo_cfg.algo = {}
+            algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+            algo = instantiate_algorithm(cfg=algo_cfg)
+            cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_search.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+                continue
+            algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+            # Instantiate a dataset class
+            cfg_path = Path(".").joinpath(f"conf/data/{data_name}.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping dataset {data_name} - no config at {cfg_path}")
+                continue
+            data_cfg = OmegaConf.create(algo_cfg)
+            data_cfg.data = {}
+            data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
+            # Sweep dataset scale parameters
+            for scale in data_cfg.data.scale:
+                scale_cfg = OmegaConf.create(data_cfg)
+                scale_cfg.data.scale = scale
+                dataset = instantiate_dataset(cfg=scale_cfg)
+                # Download the dataset files, recall is not measured so no groundtruth is generated
+                pregen_cfg = OmegaConf.create(scale_cfg)
+                pregen_cfg.groundtruth = False
+                pregenerate(dataset=dataset, scale_cfg=pregen_cfg)
+                base_vecs = dataset.vecs_base()
+                base_size = base_vecs.shape[0]
+                query_vecs = np.ascontiguousarray(dataset.vecs_query()[base_size:])
+                # Sweep algorithm build parameters
+                ret_all = []
+                for build in data_cfg.algo.build:
+                    build_cfg = OmegaConf.create(scale_cfg)
+                    build_cfg.algo.build = build
+                    # Build the index
+                    log.info(f"Start to build with {build}")
+                    algo.init(D = base_vecs.shape[1], maxN = base_size * 2, cfg = build_cfg)
+                    if algo.has_train():
+                        log.info("Start to train")
+                        algo.train(vecs=dataset.vecs_train())
+                    log.info("Start to add")
+                    algo.add_chunks(vecs=base_vecs, start = 0, count = base_size, chunk = base_cfg.get("chunk"))
+                    # Sweep algorithm search parameters
+                    ret = []
+                    for query in build_cfg.algo.query:
+                        query_cfg = OmegaConf.create(build_cfg)
+                        query_cfg.algo.query = query
+                        log.info(f"Start to load with {query}")
+                        rates = sweep(algo=algo, vecs=query_vecs, cfg=query_cfg, load=base_cfg.load)
+                        ret.append({
+                            "param_build": dict(build),
+                            "param_query": dict(query),
+                            "param_load": OmegaConf.to_container(base_cfg.load),
+                            "rates": rates
+                        })
+                        lines.append({
+                            "xs": [r["throughput"] for r in rates], "ys": [r["latency_p99"] for r in rates],
+                            "ctrls": [r["rate"] for r in rates], "ctrl_label": "rate",
+                            "label": f"{algo_name}-{scale}(" + stringify_dict(d=dict(build)) + ", " + stringify_dict(d=dict(query)) + ")"
+                        })
+                        log.info("Finish")
+                    ret_all.append(ret)
+
+                # Save results to output directory
+                out_path = Path(f"{base_cfg.output}/{data_name}/{algo_name}/load-{scale}-{timestamp}.yaml")
+                out_path.parent.mkdir(exist_ok=True, parents=True)
+                with out_path.open("wt") as f:
+                    yaml.dump(ret_all, f)
+
+        if len(lines) == 0:
+            continue
+        # Save the throughput against tail latency curves to the image directory
+        log.info(f"Writing {data_name} plot to {img.resolve()}")
+        draw_loglog(lines=lines, xlabel="throughput (query/sec)", ylabel="p99 latency (sec)", title=f"Open-loop load {data_name}",
+            filename=img / f"load-{data_name}-{timestamp}.png", with_ctrl=False, with_error=False, width=10, height=8)
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,151 @@ from datetime import datetime
 import time
 import gc
 import tracemalloc
+import tempfile
+import shutil
 # Internal functions
 from dyann.algo.proxy import instantiate_algorithm
 from dyann.data.proxy import instantiate_dataset
-from dyann.util import recall_at_r
+from dyann.util import recall_at_r, stringify_dict, Usage
 
 # Initialise message logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
 log = logging.getLogger(__name__)
 
+MIN_TIME = 1e-9 # Floor of the timings adjusted for the harness overhead
+
+def pregenerate(dataset, scale_cfg):
+    """Pregenerate dataset files and groundtruth using the first linear build configuration"""
+    pregen_cfg = OmegaConf.create(scale_cfg)
+    pregen_cfg.algo = {}
+    pregen_path = Path(".").joinpath("./conf/algo/linear_build.yaml")
+    pregen_cfg = OmegaConf.merge(pregen_cfg, OmegaConf.load(pregen_path))
+    pregen_cfg.algo.build = pregen_cfg.algo.build[0]
+    dataset.pregen(cfg=pregen_cfg)
+
+def calibrate(dataset, scale_cfg):
+    """ Evaluate a no-op algorithm on the dataset to measure the harness overhead included in the timings
+
+    Returns:
+        The mean search and build time per query of the no-op algorithm
+    """
+    from dyann.algo.noop import NoopANN
+    usage = getattr(dataset, "usage", None)
+    dataset.usage = Usage() # Keep the calibration out of the accounting of the next benchmark
+    runtime, _ = dataset.evaluate(NoopANN(), scale_cfg)
+    dataset.usage = usage
+    return np.mean(runtime[:,:2], axis=0)
+
+def benchmark(algo, dataset, base_vecs, query_cfg, base_cfg, snapshots=None, overhead=None):
+    """ Build an index on the base vectors and evaluate it on the dataset
+
+    Parameters:
+        algo: An ANN algorithm inheriting from BaseANN
+        dataset: A dataset inheriting from BaseDataset
+        base_vecs: Base set of sample vectors used to initialise the index
+        query_cfg: OmegaConf object with the build and search properties at cfg.algo.build and cfg.algo.query
+        base_cfg: OmegaConf object with the run properties
+        snapshots: (optional) Directory path and index snapshots by build properties, grown from when the base set extends them
+        overhead: (optional) Harness search and build time per query measured by calibrate, subtracted into separate adjusted timings
+    Returns:
+        A dictionary of results for the build and search properties
+    """
+    build, query = query_cfg.algo.build, query_cfg.algo.query
+    base_size = base_vecs.shape[0]
+    usage = Usage(enabled=base_cfg.get("usage", True))
+    if hasattr(dataset, "usage"):
+        dataset.usage = usage
+    # Build the index
+    log.info(f"Start to build with {build}")
+    if base_cfg.mem_type == "trc_mem" or base_cfg.mem_type == "trc_peak":
+        gc.collect()
+        tracemalloc.start()
+    m0 = algo.get_memory_usage(base_cfg.mem_type)
+    t0 = time.time()
+    algo.init(D = base_vecs.shape[1], maxN = base_size * 2, cfg = query_cfg)
+    # Grow the index from the snapshot of a smaller scale, the base sets of the scale sweep share their leading samples
+    key = stringify_dict(d=dict(build))
+    snapshot = snapshots["builds"].get(key) if snapshots is not None else None
+    restored, buildtime_restored = 0, 0.0
+    if snapshot is not None and snapshot["rows"] <= base_size and np.array_equal(np.asarray(base_vecs[snapshot["rows"]-1]), snapshot["last"]):
+        log.info(f"Start to restore {snapshot['rows']} samples")
+        algo.restore(np.fromfile(snapshot["path"], dtype='uint8'))
+        restored, buildtime_restored = snapshot["rows"], snapshot["buildtime"]
+    elif algo.has_train():
+        log.info("Start to train")
+        with usage.phase("train", items=0):
+            algo.train(vecs=dataset.vecs_train())
+    log.info("Start to add")
+    with usage.phase("build", items=base_size - restored):
+        algo.add_chunks(vecs=base_vecs, start = restored, count = base_size - restored, chunk = base_cfg.get("chunk"))
+
+    t1 = time.time()
+    m1 = algo.get_memory_usage(base_cfg.mem_type)
+    # Charge the builds of the smaller scales, so the time approximates a build from empty
+    buildtime_per_base = (buildtime_restored + t1 - t0) / base_size
+    memory_per_base = (m1 - m0) / base_size
+    if snapshots is not None and restored < base_size:
+        state = algo.snapshot()
+        if state is not None:
+            # Kept on disk so the copy is not counted in the memory of the evaluation
+            path = snapshot["path"] if snapshot is not None else Path(snapshots["path"]) / f"{len(snapshots['builds'])}.bin"
+            state.tofile(path)
+            snapshots["builds"][key] = {"rows": base_size, "path": path, "last": np.array(base_vecs[base_size-1]), "buildtime": buildtime_restored + t1 - t0}
+
+    if base_cfg.mem_type == "trc_mem" or base_cfg.mem_type == "trc_peak":
+        tracemalloc.stop()
+    # Bytes held by each part of the index, free of the dataset and allocator noise in the process memory
+    index_size = algo.index_size()
+
+    # Search the index
+    log.info(f"Start to search with {query}")
+    runtime, ids = dataset.evaluate(algo, query_cfg)
+    algo.finish()
+    recall = []
+    if base_cfg.get("groundtruth", True):
+        gt = dataset.groundtruth()[:len(ids)] # Shorter when only a prefix of the workload was evaluated
+        recall = [recall_at_r(I=ids, gt=gt, r=r) for r in range(base_cfg.topk,0,-20)]
+    searchtime_per_query = runtime[:,0]
+    buildtime_per_query = runtime[:,1]
+    runtime_per_query = [x+y for x,y in zip(searchtime_per_query, buildtime_per_query)]
+    adjusted = {}
+    if overhead is not None:
+        # The raw timings are kept, adjusted timings are floored so throughputs stay finite when the overhead is larger
+        timings = runtime[:,:2] - overhead
+        floored = int(np.count_nonzero(timings < MIN_TIME))
+        if floored > 0:
+            log.warning(f"Overhead exceeds {floored} timings of {query}, adjusted timings floored at {MIN_TIME}s")
+        timings = np.maximum(timings, MIN_TIME)
+        adjusted = {"searchtime_per_query_adjusted": timings[:,0], "buildtime_per_query_adjusted": timings[:,1],
+                    "runtime_per_query_adjusted": timings[:,0] + timings[:,1]}
+    memory_query = runtime[:,2]
+    series = getattr(dataset, "series", {})
+
+    # Compile results
+    return {
+        "scale": query_cfg.data.scale,
+        "base_size": int(base_size),
+        "param_build": dict(build),
+        "buildtime_per_base": float(buildtime_per_base),
+        "buildtime_incremental": float(t1 - t0),
+        "build_restored": int(restored),
+        "memory_per_base": float(memory_per_base),
+        "index_bytes": {key: int(value) for key, value in index_size.items()},
+        "index_bytes_per_base": {key: float(value / base_size) for key, value in index_size.items()},
+        "param_query": dict(query),
+        "runtime_per_query": [float(x) for x in runtime_per_query],
+        "searchtime_per_query": [float(x) for x in searchtime_per_query],
+        "buildtime_per_query": [float(x) for x in buildtime_per_query],
+        "memory_query": [float(x) for x in memory_query],
+        "overhead_per_query": [float(x) for x in overhead] if overhead is not None else [],
+        **{key: [float(x) for x in values] for key, values in adjusted.items()},
+        "recall": [[float(x) for x in y] for y in recall],
+        "usage": usage.results(),
+        "queries_per_cpu_second": usage.per_cpu_second("query"),
+        **{key: [float(x) for x in values] for key, values in series.items()},
+        **{key: value for key, value in algo.stats.items()}
+    }
+
 def main():
     # Load base configuration values
     cfg_path = Path(".").joinpath("conf/run.yaml")
@@ -54,21 +190,21 @@ def main():
             data_cfg = OmegaConf.create(algo_cfg)
             data_cfg.data = {}
             data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
-            # Sweep dataset scale parameters
+            # Sweep dataset scale parameters, growing each index from the previous scale when incremental
+            snapshots = None
+            if base_cfg.get("incremental", False):
+                Path(base_cfg.output).mkdir(exist_ok=True, parents=True)
+                snapshots = {"path": tempfile.mkdtemp(prefix="snapshots-", dir=base_cfg.output), "builds": {}}
             for scale in data_cfg.data.scale:
                 scale_cfg = OmegaConf.create(data_cfg)
                 scale_cfg.data.scale = scale
                 # Load base dataset
                 dataset = instantiate_dataset(cfg=scale_cfg)
                 # Pregenerate dataset values
-                pregen_cfg = OmegaConf.create(scale_cfg)
-                pregen_cfg.algo = {}
-                pregen_path = Path(".").joinpath("./conf/algo/linear_build.yaml")
-                pregen_cfg = OmegaConf.merge(pregen_cfg, OmegaConf.load(pregen_path))
-                pregen_cfg.algo.build = pregen_cfg.algo.build[0]
-                dataset.pregen(cfg=pregen_cfg)
+                pregenerate(dataset=dataset, scale_cfg=scale_cfg)
                 base_vecs = dataset.vecs_base()
-                base_size = base_vecs.shape[0]
+                # Measure the harness overhead once per scale
+                overhead = calibrate(dataset=dataset, scale_cfg=scale_cfg) if base_cfg.get("calibrate", False) else None
                 # Sweep algorithm build and update parameters
                 ret_all = []
                 for build in data_cfg.algo.build:
@@ -80,49 +216,7 @@ def main():
                         query_cfg = OmegaConf.create(build_cfg)
                         query_cfg.algo.query = query
 
-                        # Build the index
-                        log.info(f"Start to build with {build}")
-                        if base_cfg.mem_type == "trc_mem" or base_cfg.mem_type == "trc_peak":
-                            gc.collect()
-                            tracemalloc.start()
-                        m0 = algo.get_memory_usage(base_cfg.mem_type)
-                        t0 = time.time()
-                        algo.init(D = base_vecs.shape[1], maxN = base_size * 2, cfg = build_cfg)
-                        if algo.has_train():
-                            log.info("Start to train")
-                            algo.train(vecs=dataset.vecs_train())
-                        log.info("Start to add")
-                        algo.do_add(vecs=base_vecs, start = 0, count = base_size)
-
-                        t1 = time.time()
-                        m1 = algo.get_memory_usage(base_cfg.mem_type)
-                        buildtime_per_base = (t1 - t0) / base_size
-                        memory_per_base = (m1 - m0) / base_size
-
-                        if base_cfg.mem_type == "trc_mem" or base_cfg.mem_type == "trc_peak":
-                            tracemalloc.stop()
-                        
-                        # Search the index
-                        log.info(f"Start to search with {query}")
-                        runtime, ids = dataset.evaluate(algo, query_cfg)
-                        recall = [recall_at_r(I=ids, gt=dataset.groundtruth(), r=r) for r in range(base_cfg.topk,0,-20)]
-                        searchtime_per_query = runtime[:,0]
-                        buildtime_per_query = runtime[:,1]
-                        runtime_per_query = [x+y for x,y in zip(searchtime_per_query, buildtime_per_query)]
-                        memory_query = runtime[:,2]
-
-                        # Compile results
-                        ret.append({
-                            "param_build": dict(build),
-                            "buildtime_per_base": float(buildtime_per_base),
-                            "memory_per_base": float(memory_per_base),
-                            "param_query": dict(query),
-                            "runtime_per_query": [float(x) for x in runtime_per_query],
-                            "searchtime_per_query": [float(x) for x in searchtime_per_query],
-                            "buildtime_per_query": [float(x) for x in buildtime_per_query],
-                            "memory_query": [float(x) for x in memory_query],
-                            "recall": [[float(x) for x in y] for y in recall]
-                        })
+                        ret.append(benchmark(algo=algo, dataset=dataset, base_vecs=base_vecs, query_cfg=query_cfg, base_cfg=base_cfg, snapshots=snapshots, overhead=overhead))
                         log.info("Finish")
 
                     ret_all.append(ret)
@@ -132,6 +226,8 @@ def main():
                 out_path.parent.mkdir(exist_ok=True, parents=True)
                 with out_path.open("wt") as f:
                     yaml.dump(ret_all, f)
+            if snapshots is not None:
+                shutil.rmtree(snapshots["path"])
 
 if __name__ == "__main__":
     main()
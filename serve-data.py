@@ -0,0 +1,58 @@
+from omegaconf import DictConfig, OmegaConf
+import logging
+from pathlib import Path
+import time
+from dyann.data.proxy import instantiate_dataset
+from dyann.data.shared import publish
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/run.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.load(cfg_path)
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+
+    # Publish the sample vectors of each dataset
+    blocks = {}
+    for data_name in base_cfg.data:
+        # Load dataset configuration values
+        cfg_path = Path(".").joinpath(f"conf/data/{data_name}.yaml")
+        if not cfg_path.exists():
+            log.info(f"Skipping dataset {data_name} - no config at {cfg_path}")
+            continue
+        data_cfg = OmegaConf.create(base_cfg)
+        data_cfg.data = {}
+        data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
+        data_cfg.data.scale = data_cfg.data.scale[0]
+        dataset = instantiate_dataset(cfg=data_cfg)
+        for path in dataset.files():
+            path = Path(path).resolve()
+            if path in blocks:
+                continue
+            if not path.exists():
+                log.info(f"Skipping {path} - run download.py first")
+                continue
+            log.info(f"Serving {path}")
+            blocks[path] = publish(path)
+
+    # Hold the blocks until interrupted, benchmark processes started with shared=true map them read-only
+    log.info(f"Serving {len(blocks)} files, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    for shm in blocks.values():
+        shm.close()
+        shm.unlink()
+    log.info("Done")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# File and data handling 
+from omegaconf import DictConfig, OmegaConf
+import logging
+from pathlib import Path
+import yaml
+import numpy as np
+from datetime import datetime
+# Internal functions
+from dyann.algo.proxy import instantiate_algorithm
+from dyann.data.proxy import instantiate_dataset
+from run import benchmark, pregenerate
+
+# Initialise message logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+def score(ret, topk):
+    """Mean recall and throughput of a result, using the shadow estimate when run without groundtruth"""
+    if len(ret["recall"]) == 0:
+        if "shadow_recall" not in ret:
+            raise ValueError(f"No recall to tune {ret['param_build']} on, run with groundtruth=true or a shadow algorithm")
+        recall = ret["shadow_recall"]
+    else:
+        recall = np.mean(np.array(ret["recall"][0]) / topk)
+    throughput = np.mean(1.0 / np.array(ret["runtime_per_query"]))
+    return recall, throughput
+
+def pareto_ranks(points, margin):
+    """ Non-dominated sorting of (recall, throughput) points
+
+    Parameters:
+        points: List of (recall, throughput) tuples
+        margin: A point is only dominated by one with recall higher by the margin and throughput higher by the relative margin
+    Returns:
+        The index of the Pareto front containing each point, starting from 0
+    """
+    def dominates(a, b):
+        return a[0] >= b[0] + margin and a[1] >= b[1] * (1 + margin)
+    ranks = -1 * np.ones([len(points)]).astype('int')
+    remaining = set(range(len(points)))
+    rank = 0
+    while len(remaining) > 0:
+        front = [i for i in remaining if not any(dominates(points[j], points[i]) for j in remaining)]
+        ranks[front] = rank
+        remaining = remaining - set(front)
+        rank = rank + 1
+    return ranks
+
+def main():
+    # Load base configuration values
+    cfg_path = Path(".").joinpath("conf/tune.yaml")
+    if not cfg_path.exists():
+        log.info(f"No config at {cfg_path}")
+        return
+    default_cfg = OmegaConf.merge(OmegaConf.load(Path(".").joinpath("conf/run.yaml")), OmegaConf.load(cfg_path))
+    base_cfg = OmegaConf.merge(default_cfg, OmegaConf.from_cli())
+    log.info(OmegaConf.to_yaml(base_cfg))
+    eta = base_cfg.tune.eta
+
+    # Sweep algorithms
+    for algo_name in base_cfg.algo:
+        # Instantiate a search algorithm class
+        cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_build.yaml")
+        if not cfg_path.exists():
+            log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+            continue
+        algo_cfg = OmegaConf.create(base_cfg)
+        algo_cfg.algo = {}
+        algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+        algo = instantiate_algorithm(cfg=algo_cfg)
+        cfg_path = Path(".").joinpath(f"conf/algo/{algo_name}_search.yaml")
+        if not cfg_path.exists():
+            log.info(f"Skipping algorithm {algo_name} - no config at {cfg_path}")
+            continue
+        algo_cfg = OmegaConf.merge(algo_cfg, OmegaConf.load(cfg_path))
+        # Sweep datasets
+        for data_name in base_cfg.data:
+            # Instantiate a dataset class
+            cfg_path = Path(".").joinpath(f"conf/data/{data_name}.yaml")
+            if not cfg_path.exists():
+                log.info(f"Skipping dataset {data_name} - no config at {cfg_path}")
+                continue
+            data_cfg = OmegaConf.create(algo_cfg)
+            data_cfg.data = {}
+            data_cfg = OmegaConf.merge(data_cfg, OmegaConf.load(cfg_path))
+            # Sweep dataset scale parameters
+            for scale in data_cfg.data.scale:
+                scale_cfg = OmegaConf.create(data_cfg)
+                scale_cfg.data.scale = scale
+                # Load base dataset
+                dataset = instantiate_dataset(cfg=scale_cfg)
+                pregenerate(dataset=dataset, scale_cfg=scale_cfg)
+                base_vecs = dataset.vecs_base()
+                # Enumerate all build and search parameter pairs
+                configs = []
+                for b, build in enumerate(data_cfg.algo.build):
+                    for query in data_cfg.algo.query:
+                        query_cfg = OmegaConf.create(scale_cfg)
+                        query_cfg.algo.build = build
+                        query_cfg.algo.query = query
+                        configs.append((b, query_cfg))
+                # Successive halving over growing prefixes of the workload
+                prefix = base_cfg.tune.min_prefix
+                rungs = []
+                while True:
+                    prefix = min(prefix, 1.0)
+                    log.info(f"Evaluating {len(configs)} configurations on {prefix:.3f} of the workload")
+                    dataset.prefix = prefix
+                    results = [benchmark(algo=algo, dataset=dataset, base_vecs=base_vecs, query_cfg=query_cfg, base_cfg=base_cfg) for _, query_cfg in configs]
+                    points = [score(ret, base_cfg.topk) for ret in results]
+                    rungs.append([{"prefix": float(prefix), "param_build": ret["param_build"], "param_query": ret["param_query"],
+                        "recall": float(point[0]), "throughput": float(point[1])} for ret, point in zip(results, points)])
+                    if prefix >= 1.0:
+                        break
+                    # Promote the least dominated configurations, breaking ties by the harmonic mean of recall and relative throughput
+                    ranks = pareto_ranks(points=points, margin=base_cfg.tune.margin)
+                    fastest = max(point[1] for point in points)
+                    harmonic = [2 * r * t / fastest / (r + t / fastest) if r + t > 0 else 0 for r, t in points]
+                    order = sorted(range(len(configs)), key=lambda i: (ranks[i], -harmonic[i]))
+                    configs = [configs[i] for i in sorted(order[:max(int(np.ceil(len(configs) / eta)), 1)])]
+                    prefix = prefix * eta
+                # Group the results of the final survivors by build parameters
+                ret_all = {}
+                for (b, _), ret in zip(configs, results):
+                    ret_all.setdefault(b, []).append(ret)
+                ret_all = [ret_all[b] for b in sorted(ret_all)]
+
+                # Save results to output directory
+                timestamp = datetime.now().strftime('%y-%m-%d-%H-%M-%S')
+                out_path = Path(f"{base_cfg.output}/{data_name}/{algo_name}/result-{timestamp}.yaml")
+                out_path.parent.mkdir(exist_ok=True, parents=True)
+                with out_path.open("wt") as f:
+                    yaml.dump(ret_all, f)
+                with out_path.with_name(f"tune-{timestamp}.yaml").open("wt") as f:
+                    yaml.dump(rungs, f)
+                log.info("Finish")
+
+if __name__ == "__main__":
+    main()